@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless benchmark of the legend dock's hot paths.
+
+Runs on plain Python without QGIS or Qt: fake_qgis installs stand-ins for
+QgsProject, the layer tree, layers and renderers, then the real plugin code
+is imported and timed against a synthetic project of N layers nested D
+groups deep, with K classes on the displayed layer and V legend_ variables.
+
+Results are printed (or written with --output) as JSON so that runs of two
+releases can be compared with --compare.
+
+Usage:
+    python benchmarks/bench_hot_paths.py --layers 300 --depth 6 --classes 2000 --variables 300
+    python benchmarks/bench_hot_paths.py --output new.json --compare old.json
+"""
+
+import argparse
+import gc
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+PACKAGE = 'legend_view_bench'
+
+sys.path.insert(0, BENCH_DIR)
+import fake_qgis  # noqa: E402
+
+
+def load_package():
+    """Import the plugin directory as a package, whatever its folder name"""
+    fake_qgis.install()
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, os.path.join(PLUGIN_DIR, '__init__.py'),
+            submodule_search_locations=[PLUGIN_DIR])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = package
+        spec.loader.exec_module(package)
+    return sys.modules[PACKAGE]
+
+
+def load_plugin():
+    load_package()
+    return importlib.import_module(PACKAGE + '.legend_view_dockwidget')
+
+
+def single_result(seconds):
+    return {'runs': 1, 'min_s': seconds, 'median_s': seconds, 'mean_s': seconds, 'max_s': seconds}
+
+
+def time_plugin_startup(iface):
+    """What QGIS pays at start-up (import + initGui) and on the first run()"""
+    package = load_package()
+    results = {}
+
+    start = time.perf_counter()
+    plugin = package.classFactory(iface)
+    plugin.initGui()
+    results['plugin_load'] = single_result(time.perf_counter() - start)
+    results['plugin_load']['dock_module_loaded'] = PACKAGE + '.legend_view_dockwidget' in sys.modules
+
+    start = time.perf_counter()
+    plugin.run()
+    results['plugin_first_run'] = single_result(time.perf_counter() - start)
+
+    # Auto-open from a saved project: only the dock shell is on the
+    # project-load path, the legend work runs later from the event loop
+    project = fake_qgis.QgsProject.instance()
+    saved_variables = dict(project.custom_variables)
+    project.custom_variables['plugin_' + plugin.menu.lstrip('&')] = '1'
+    auto_plugin = package.classFactory(iface)
+    auto_plugin.initGui()
+    start = time.perf_counter()
+    auto_plugin.checkLoadedProject()
+    results['plugin_project_open'] = single_result(time.perf_counter() - start)
+    start = time.perf_counter()
+    fake_qgis.process_events()
+    results['plugin_deferred_populate'] = single_result(time.perf_counter() - start)
+    project.custom_variables = saved_variables
+    return plugin, results
+
+
+class FakeIface(fake_qgis.QObject):
+
+    currentLayerChanged = fake_qgis.pyqtSignal()
+
+    def __init__(self):
+        super(FakeIface, self).__init__()
+        self._active = None
+
+    def activeLayer(self):
+        return self._active
+
+    def setActiveLayer(self, layer):
+        self._active = layer
+        self.currentLayerChanged.emit(layer)
+        return True
+
+
+class SyntheticProject:
+    """N layers spread over group chains D levels deep"""
+
+    def __init__(self, layers, depth, classes, variables):
+        self.project = fake_qgis.QgsProject.reset()
+        root = self.project.layerTreeRoot()
+        branches = max(1, int(layers ** 0.5))
+        groups = {}
+        self.layers = []
+        self.paths = []
+
+        for i in range(layers):
+            branch = i % branches
+            path = []
+            parent = root
+            for level in range(depth):
+                name = 'Grp%dx%d' % (branch, level)
+                path.append(name)
+                key = tuple(path)
+                if key not in groups:
+                    groups[key] = parent.addGroup(name)
+                parent = groups[key]
+
+            # Every fifth layer has underscores in its name, like real data
+            name = 'land_parcel_%d' % i if i % 5 == 0 else 'Layer%d' % i
+            class_count = classes if i == 0 else 5
+            values = list(range(class_count - 1)) + [None]
+            renderer = fake_qgis.QgsCategorizedSymbolRenderer('class', values)
+            layer = fake_qgis.QgsVectorLayer(name, renderer)
+            self.project.addMapLayer(layer)
+            parent.addLayer(layer)
+            self.layers.append(layer)
+            self.paths.append(path + [name])
+
+        variables_map = {}
+        for i in range(variables):
+            if i < layers:
+                name = 'legend_' + '_'.join(self.paths[i])
+            else:
+                # Stale variables never resolve, the worst case for lookups
+                name = 'legend_Missing%d_layer_%d' % (i % 7, i)
+            if i % 3 == 0:
+                value = str(i)
+            elif i % 3 == 1:
+                value = '%d.5' % i
+            else:
+                value = ''
+            variables_map[name] = value
+        self.project.custom_variables = variables_map
+
+        self.display_layer = self.layers[0]
+        self.deep_layer = self.layers[-1]
+
+
+def time_call(function, setup=None, repeat=5):
+    """Wall time of function over repeat runs, plus peak traced memory"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    # Separate pass for memory so tracing overhead does not skew timings
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'runs': repeat,
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.mean(timings),
+        'max_s': max(timings),
+        'peak_kib': round(peak / 1024.0, 1),
+    }
+
+
+def run_benchmarks(args):
+    if args.profile:
+        fake_qgis.QSettings().setValue('LegendView/profiling', True)
+    synthetic = SyntheticProject(args.layers, args.depth, args.classes, args.variables)
+    iface = FakeIface()
+    iface.setActiveLayer(synthetic.display_layer)
+
+    plugin, results = time_plugin_startup(iface)
+    dockwidget = load_plugin()
+
+    construct_start = time.perf_counter()
+    dock = dockwidget.LegendViewDockWidget(iface)
+    results['dock_construct'] = single_result(time.perf_counter() - construct_start)
+
+    variable_names = [name[len('legend_'):] for name in synthetic.project.custom_variables]
+
+    def invalidate_tree_caches():
+        for attribute in ('layerIndex', 'layerPaths'):
+            cache = getattr(dock, attribute, None)
+            if cache is not None and hasattr(cache, 'invalidate'):
+                cache.invalidate()
+
+    def resolve_all():
+        for name in variable_names:
+            dock.findLayerByVariableName(name)
+
+    results['findLayerByVariableName'] = time_call(resolve_all, invalidate_tree_caches, args.repeat)
+
+    def combo_setup():
+        invalidate_tree_caches()
+        dock.comboBox.clear()
+
+    results['comboDataSet'] = time_call(dock.comboDataSet, combo_setup, args.repeat)
+
+    def show_setup():
+        dock.currentLayer = synthetic.display_layer
+        dock.legendLayerId = None
+
+    results['showLegend'] = time_call(dock.showLegend, show_setup, args.repeat)
+
+    def show_again_setup():
+        dock.currentLayer = synthetic.display_layer
+
+    results['showLegend_sameLayer'] = time_call(dock.showLegend, show_again_setup, args.repeat)
+
+    model = getattr(dock, 'legendModel', None)
+    renderer = getattr(dock, 'previewRenderer', None)
+    if model is not None:
+        visible_rows = min(args.visible_rows, model.rowCount())
+        decoration_role = dockwidget.DecorationRole
+
+        def paint_visible():
+            for row in range(visible_rows):
+                model.data(model.index(row, 0), decoration_role)
+            if renderer is not None:
+                renderer.waitForDone()
+                for row in range(visible_rows):
+                    model.data(model.index(row, 0), decoration_role)
+
+        def clear_previews():
+            model.previewCache().clear()
+
+        results['previewRender_visibleRows'] = time_call(paint_visible, clear_previews, args.repeat)
+        results['previewRender_cached'] = time_call(paint_visible, None, args.repeat)
+
+    def select_setup():
+        iface.setActiveLayer(synthetic.deep_layer)
+        dock.comboBox.setCurrentIndex(0)
+
+    results['selectCurrentLayer'] = time_call(dock.selectCurrentLayer, select_setup, args.repeat)
+
+    def register_setup():
+        iface.setActiveLayer(synthetic.deep_layer)
+        invalidate_tree_caches()
+
+    results['registerCurrentLayer'] = time_call(dock.registerCurrentLayer, register_setup, args.repeat)
+
+    saved_variables = dict(synthetic.project.custom_variables)
+
+    def bulk_register_setup():
+        synthetic.project.custom_variables = dict(saved_variables)
+
+    results['registerLayers_bulk'] = time_call(
+        lambda: dock.registerLayers(synthetic.layers), bulk_register_setup, args.repeat)
+    synthetic.project.custom_variables = saved_variables
+
+    report = {
+        'meta': {
+            'plugin_version': plugin_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'params': {
+            'layers': args.layers,
+            'depth': args.depth,
+            'classes': args.classes,
+            'variables': args.variables,
+            'repeat': args.repeat,
+            'visible_rows': args.visible_rows,
+        },
+        'results': results,
+    }
+    if args.profile:
+        profiling = importlib.import_module(PACKAGE + '.profiling')
+        report['profile'] = profiling.sharedProfiler().summary()
+    return report
+
+
+def plugin_version():
+    try:
+        with open(os.path.join(PLUGIN_DIR, 'metadata.txt'), encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('version='):
+                    return line.strip().split('=', 1)[1]
+    except OSError:
+        pass
+    return 'unknown'
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    lines = ['%-28s %12s %12s %8s' % ('hot path', 'baseline', 'current', 'ratio')]
+    for name, result in current['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        ratio = result['median_s'] / old['median_s'] if old['median_s'] else float('inf')
+        lines.append('%-28s %10.2fms %10.2fms %7.2fx' % (
+            name, old['median_s'] * 1000, result['median_s'] * 1000, ratio))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--layers', type=int, default=300, help='number of layers (N)')
+    parser.add_argument('--depth', type=int, default=6, help='group nesting depth (D)')
+    parser.add_argument('--classes', type=int, default=2000, help='classes on the displayed layer (K)')
+    parser.add_argument('--variables', type=int, default=300, help='legend_ project variables (V)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per hot path')
+    parser.add_argument('--visible-rows', type=int, default=30, help='rows painted per preview pass')
+    parser.add_argument('--profile', action='store_true',
+                        help='enable the plugin profiler and add its per-phase summary (adds overhead)')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON to compare medians against')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        sys.stderr.write(compare(report, args.compare) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
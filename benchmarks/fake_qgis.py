@@ -0,0 +1,1101 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight stand-ins for the parts of QGIS and Qt used by the legend dock.
+
+install() registers fake ``qgis``, ``qgis.PyQt.*``, ``qgis.core`` and
+``qgis.gui`` modules so the plugin can be imported and its hot paths timed on
+a plain Python installation.  The fakes model the layer tree, project
+variables, layers and renderers faithfully enough for the dock's own Python
+code to do its real work; anything that would draw is a no-op.
+
+PyQt5/PyQt6 are blocked while the fakes are installed so a locally installed
+Qt is never mixed with the fake classes.
+"""
+
+import sys
+import types
+import xml.etree.ElementTree as ElementTree
+
+
+# ---------------------------------------------------------------------------
+# Generic stubs
+# ---------------------------------------------------------------------------
+
+class Stub:
+    """Accepts any call, attribute access or arithmetic (for widgets etc.)"""
+
+    NUMBER = 16
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = Stub()
+        object.__setattr__(self, name, value)
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __int__(self):
+        return self.NUMBER
+
+    __index__ = __int__
+
+    def __float__(self):
+        return float(self.NUMBER)
+
+    def __or__(self, other):
+        return self
+
+    __ror__ = __and__ = __rand__ = __invert__ = __or__
+
+    def __sub__(self, other):
+        return self.NUMBER - other
+
+    def __add__(self, other):
+        return self.NUMBER + other
+
+    def __mul__(self, other):
+        return self.NUMBER * other
+
+    __rmul__ = __mul__
+    __radd__ = __add__
+
+
+class _Enum(int):
+    """Integer constant that also acts as a scoped enum namespace"""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Enum(abs(hash(name)) % 4096)
+
+    def __or__(self, other):
+        return _Enum(int(self) | int(other))
+
+    __ror__ = __or__
+
+
+class _StubMeta(type):
+    """Class-level attribute access (enums, flags) yields integer constants"""
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = _Enum(abs(hash(name)) % 4096)
+        setattr(cls, name, value)
+        return value
+
+
+class StubClass(Stub, metaclass=_StubMeta):
+    pass
+
+
+def _stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+
+    def __getattr__(attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        value = type(attr, (StubClass,), {})
+        setattr(module, attr, value)
+        return value
+
+    module.__getattr__ = __getattr__
+    return module
+
+
+# ---------------------------------------------------------------------------
+# QtCore
+# ---------------------------------------------------------------------------
+
+class BoundSignal:
+
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot, *args):
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots.clear()
+            return
+        try:
+            self._slots.remove(slot)
+        except ValueError:
+            raise TypeError('slot is not connected')
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+    def __getitem__(self, signature):
+        return self
+
+    def receivers(self):
+        return len(self._slots)
+
+
+class pyqtSignal:
+
+    def __init__(self, *types, **kwargs):
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        signal = instance.__dict__.get(self._name)
+        if signal is None:
+            signal = BoundSignal()
+            instance.__dict__[self._name] = signal
+        return signal
+
+
+class QObject:
+
+    _signals_blocked = False
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def blockSignals(self, block):
+        previous = getattr(self, '_signals_blocked', False)
+        self._signals_blocked = block
+        return previous
+
+    def deleteLater(self):
+        pass
+
+    def __getattr__(self, name):
+        # Widget methods the benchmark does not care about
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Stub()
+
+
+class Qt(StubClass):
+    DisplayRole = 0
+    DecorationRole = 1
+    ToolTipRole = 3
+    CheckStateRole = 10
+    FontRole = 6
+    UserRole = 256
+
+
+class QSize:
+
+    def __init__(self, width=-1, height=-1):
+        if isinstance(width, QSize):
+            width, height = width.width(), width.height()
+        self._width = int(width)
+        self._height = int(height)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def __eq__(self, other):
+        return isinstance(other, QSize) and (self._width, self._height) == (other._width, other._height)
+
+    def __hash__(self):
+        return hash((self._width, self._height))
+
+
+class QModelIndex:
+
+    def __init__(self, row=-1, column=-1):
+        self._row = row
+        self._column = column
+
+    def isValid(self):
+        return self._row >= 0
+
+    def row(self):
+        return self._row
+
+    def column(self):
+        return self._column
+
+
+class QAbstractItemModel(QObject):
+
+    dataChanged = pyqtSignal()
+    headerDataChanged = pyqtSignal()
+    modelReset = pyqtSignal()
+    rowsInserted = pyqtSignal()
+    rowsRemoved = pyqtSignal()
+
+    def index(self, row, column=0, parent=None):
+        return QModelIndex(row, column)
+
+    def beginResetModel(self):
+        pass
+
+    def endResetModel(self):
+        self.modelReset.emit()
+
+    def beginInsertRows(self, parent, first, last):
+        pass
+
+    def endInsertRows(self):
+        self.rowsInserted.emit()
+
+    def beginRemoveRows(self, parent, first, last):
+        pass
+
+    def endRemoveRows(self):
+        self.rowsRemoved.emit()
+
+    def beginMoveRows(self, *args):
+        return True
+
+    def endMoveRows(self):
+        pass
+
+
+class QTimer(QObject):
+
+    timeout = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(QTimer, self).__init__(parent)
+        self._active = False
+        self._interval = 0
+
+    def setSingleShot(self, single_shot):
+        pass
+
+    def setInterval(self, msecs):
+        self._interval = msecs
+
+    def start(self, msecs=None):
+        if msecs is not None:
+            self._interval = msecs
+        self._active = True
+
+    def stop(self):
+        self._active = False
+
+    def isActive(self):
+        return self._active
+
+    def fire(self):
+        """Benchmark hook: run the timeout as if the interval elapsed"""
+        if self._active:
+            self._active = False
+            self.timeout.emit()
+
+    @staticmethod
+    def singleShot(msecs, callback):
+        _pending_single_shots.append(callback)
+
+
+_pending_single_shots = []
+
+
+def process_events():
+    """Run the QTimer.singleShot callbacks queued so far"""
+    while _pending_single_shots:
+        _pending_single_shots.pop(0)()
+
+
+class QRunnable:
+
+    def __init__(self):
+        pass
+
+
+class QThreadPool(QObject):
+
+    def __init__(self, parent=None):
+        super(QThreadPool, self).__init__(parent)
+        self._queue = []
+
+    def setMaxThreadCount(self, count):
+        pass
+
+    def start(self, runnable):
+        self._queue.append(runnable)
+
+    def clear(self):
+        self._queue.clear()
+
+    def waitForDone(self, msecs=-1):
+        # Runs queued jobs on the calling thread
+        while self._queue:
+            self._queue.pop(0).run()
+        return True
+
+
+class QThread(QObject):
+
+    @staticmethod
+    def idealThreadCount():
+        return 4
+
+
+class QCoreApplication(StubClass):
+
+    @staticmethod
+    def translate(context, text, *args):
+        return text
+
+
+class QSettings(QObject):
+
+    # Shared by every instance, like the user's settings file
+    _values = {}
+
+    def value(self, key, default=None, type=None):
+        return self._values.get(key, default)
+
+    def setValue(self, key, value):
+        self._values[key] = value
+
+
+class QVariant:
+    pass
+
+
+# ---------------------------------------------------------------------------
+# QtGui / QtWidgets
+# ---------------------------------------------------------------------------
+
+class QPixmap:
+
+    def __init__(self, width=0, height=0):
+        if isinstance(width, QSize):
+            width, height = width.width(), width.height()
+        self._width = int(width)
+        self._height = int(height)
+        self._ratio = 1.0
+
+    @staticmethod
+    def fromImage(image):
+        return QPixmap(image.width(), image.height())
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def depth(self):
+        return 32
+
+    def isNull(self):
+        return self._width <= 0 or self._height <= 0
+
+    def fill(self, color=None):
+        pass
+
+    def setDevicePixelRatio(self, ratio):
+        self._ratio = ratio
+
+    def devicePixelRatio(self):
+        return self._ratio
+
+
+class QImage(QPixmap):
+    pass
+
+
+class QColor:
+
+    def __init__(self, *rgba):
+        self._rgba = tuple(rgba) or (0, 0, 0, 255)
+
+    def rgba(self):
+        value = 0
+        for component in self._rgba:
+            value = (value << 8) | (int(component) & 0xff)
+        return value
+
+    def name(self):
+        return '#%06x' % (self.rgba() & 0xffffff)
+
+
+class QFont(Stub):
+    pass
+
+
+class QIcon(Stub):
+
+    def isNull(self):
+        return True
+
+
+class QStandardItem:
+
+    def __init__(self, *args):
+        self._data = {}
+        self._text = ''
+        for arg in args:
+            if isinstance(arg, str):
+                self._text = arg
+
+    def setData(self, value, role=None):
+        self._data[role] = value
+
+    def data(self, role=None):
+        return self._data.get(role)
+
+    def setText(self, text):
+        self._text = text
+
+    def text(self):
+        return self._text
+
+    def setIcon(self, icon):
+        pass
+
+    def setEditable(self, editable):
+        pass
+
+    def setFlags(self, flags):
+        pass
+
+    def flags(self):
+        return 0
+
+    def setToolTip(self, tip):
+        pass
+
+
+class QStandardItemModel(QAbstractItemModel):
+
+    def __init__(self, *args):
+        super(QStandardItemModel, self).__init__()
+        self._items = []
+
+    def rowCount(self, parent=None):
+        return len(self._items)
+
+    def appendRow(self, item):
+        self._items.append(item)
+        self.rowsInserted.emit()
+
+    def insertRow(self, row, item):
+        self._items.insert(row, item)
+        self.rowsInserted.emit()
+
+    def removeRow(self, row, parent=None):
+        return self.removeRows(row, 1, parent)
+
+    def removeRows(self, row, count, parent=None):
+        del self._items[row:row + count]
+        self.rowsRemoved.emit()
+        return True
+
+    def takeRow(self, row):
+        item = self._items.pop(row)
+        self.rowsRemoved.emit()
+        return [item]
+
+    def item(self, row, column=0):
+        return self._items[row] if 0 <= row < len(self._items) else None
+
+    def clear(self):
+        self._items = []
+        self.modelReset.emit()
+
+
+class QComboBox(QObject):
+    """Combo box with the subset of the item API the dock uses"""
+
+    currentIndexChanged = pyqtSignal(int)
+    currentTextChanged = pyqtSignal(str)
+
+    def __init__(self, *args):
+        super(QComboBox, self).__init__()
+        self._model = QStandardItemModel()
+        self._current = -1
+
+    def _emitIndexChanged(self):
+        if not self._signals_blocked:
+            self.currentIndexChanged.emit(self._current)
+
+    def setModel(self, model):
+        self._model = model
+
+    def model(self):
+        return self._model
+
+    def count(self):
+        return self._model.rowCount()
+
+    def addItem(self, *args):
+        icon, text, data = None, '', None
+        if args and not isinstance(args[0], str):
+            icon, args = args[0], args[1:]
+        if args:
+            text = args[0]
+        if len(args) > 1:
+            data = args[1]
+        item = QStandardItem(text)
+        item.setData(data, UserRole)
+        self._model.appendRow(item)
+        if self._current < 0:
+            self._current = 0
+            self._emitIndexChanged()
+
+    def itemData(self, index, role=None):
+        item = self._model.item(index)
+        return None if item is None else item.data(UserRole if role is None else role)
+
+    def itemText(self, index):
+        item = self._model.item(index)
+        return '' if item is None else item.text()
+
+    def findData(self, data, role=None):
+        for i in range(self.count()):
+            if self.itemData(i, role) == data:
+                return i
+        return -1
+
+    def clear(self):
+        self._model.clear()
+        if self._current != -1:
+            self._current = -1
+            self._emitIndexChanged()
+
+    def currentIndex(self):
+        return self._current
+
+    def currentData(self, role=None):
+        return self.itemData(self._current, role)
+
+    def setCurrentIndex(self, index):
+        if index != self._current:
+            self._current = index
+            self._emitIndexChanged()
+
+
+class QSpinBox(QObject):
+
+    valueChanged = pyqtSignal(int)
+
+    def __init__(self, *args):
+        super(QSpinBox, self).__init__()
+        self._value = 0
+
+    def value(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = value
+
+
+UserRole = 256
+
+
+# ---------------------------------------------------------------------------
+# qgis.core
+# ---------------------------------------------------------------------------
+
+class QgsLayerTreeNode(QObject):
+
+    addedChildren = pyqtSignal()
+    removedChildren = pyqtSignal()
+    willRemoveChildren = pyqtSignal()
+    nameChanged = pyqtSignal()
+    visibilityChanged = pyqtSignal()
+
+    def __init__(self, name=''):
+        super(QgsLayerTreeNode, self).__init__()
+        self._name = name
+        self._children = []
+        self._parent = None
+        self._checked = True
+
+    def name(self):
+        return self._name
+
+    def setName(self, name):
+        self._name = name
+        self._root().nameChanged.emit(self, name)
+
+    def parent(self):
+        return self._parent
+
+    def children(self):
+        return list(self._children)
+
+    def isVisible(self):
+        return self._checked
+
+    def itemVisibilityChecked(self):
+        return self._checked
+
+    def setItemVisibilityChecked(self, checked):
+        self._checked = checked
+
+    def _root(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def customProperty(self, key, default=None):
+        return default
+
+
+class QgsLayerTreeLayer(QgsLayerTreeNode):
+
+    def __init__(self, layer):
+        super(QgsLayerTreeLayer, self).__init__(layer.name())
+        self._layer = layer
+
+    def layer(self):
+        return self._layer
+
+    def layerId(self):
+        return self._layer.id()
+
+
+class QgsLayerTreeGroup(QgsLayerTreeNode):
+
+    def addGroup(self, name):
+        group = QgsLayerTreeGroup(name)
+        self._insert(group)
+        return group
+
+    def addLayer(self, layer):
+        node = QgsLayerTreeLayer(layer)
+        self._insert(node)
+        return node
+
+    def _insert(self, node):
+        node._parent = self
+        self._children.append(node)
+        index = len(self._children) - 1
+        self._root().addedChildren.emit(self, index, index)
+
+    def removeChildNode(self, node):
+        index = self._children.index(node)
+        self._root().willRemoveChildren.emit(self, index, index)
+        del self._children[index]
+        node._parent = None
+        self._root().removedChildren.emit(self, index, index)
+
+    def findGroup(self, name):
+        for child in self._children:
+            if isinstance(child, QgsLayerTreeGroup):
+                if child.name() == name:
+                    return child
+                group = child.findGroup(name)
+                if group is not None:
+                    return group
+        return None
+
+    def findLayer(self, layer_id):
+        for node in self.findLayers():
+            if node.layerId() == layer_id:
+                return node
+        return None
+
+    def findLayers(self):
+        found = []
+        for child in self._children:
+            if isinstance(child, QgsLayerTreeLayer):
+                found.append(child)
+            elif isinstance(child, QgsLayerTreeGroup):
+                found.extend(child.findLayers())
+        return found
+
+    def findLayerIds(self):
+        return [node.layerId() for node in self.findLayers()]
+
+    def checkedLayers(self):
+        return [node.layer() for node in self.findLayers() if node.isVisible()]
+
+
+class QgsWkbTypes(StubClass):
+    PointGeometry = 0
+    LineGeometry = 1
+    PolygonGeometry = 2
+
+
+class QgsSymbol:
+
+    def __init__(self, definition):
+        self._definition = definition
+
+    def clone(self):
+        return QgsSymbol(self._definition)
+
+    def asImage(self, size, context=None):
+        return QImage(size.width(), size.height())
+
+    def color(self):
+        return QColor(0, 0, 0)
+
+
+class QgsLegendSymbolItem:
+
+    def __init__(self, symbol, label, rule_key, checkable=True):
+        self._symbol = symbol
+        self._label = label
+        self._rule_key = rule_key
+        self._checkable = checkable
+
+    def symbol(self):
+        return self._symbol
+
+    def label(self):
+        return self._label
+
+    def ruleKey(self):
+        return self._rule_key
+
+    def isCheckable(self):
+        return self._checkable
+
+    def level(self):
+        return 0
+
+
+class QgsCategorizedSymbolRenderer:
+    """Categorized renderer over one attribute, one category per value"""
+
+    def __init__(self, attribute, values):
+        self._attribute = attribute
+        self._items = []
+        self._checked = {}
+        for i, value in enumerate(values):
+            label = '' if value is None else 'class %s' % value
+            symbol = QgsSymbol('<symbol name="%d"><color>%d,%d,%d</color></symbol>'
+                               % (i, i % 255, (i * 7) % 255, (i * 13) % 255))
+            key = str(i)
+            self._items.append(QgsLegendSymbolItem(symbol, label, key))
+            self._checked[key] = True
+
+    def classAttribute(self):
+        return self._attribute
+
+    def legendSymbolItems(self):
+        return list(self._items)
+
+    def symbols(self, context=None):
+        return [item.symbol() for item in self._items]
+
+    def legendSymbolItemChecked(self, key):
+        return self._checked.get(key, True)
+
+    def checkLegendSymbolItem(self, key, state=True):
+        self._checked[key] = state
+
+    def legendSymbolItemsCheckable(self):
+        return True
+
+    def setLegendSymbolItem(self, key, symbol):
+        for item in self._items:
+            if item.ruleKey() == key:
+                item._symbol = symbol
+
+    def type(self):
+        return 'categorizedSymbol'
+
+
+class QgsSymbolLayerUtils(StubClass):
+
+    @staticmethod
+    def symbolProperties(symbol):
+        return symbol._definition
+
+    @staticmethod
+    def symbolPreviewPixmap(symbol, size, *args):
+        return QPixmap(size)
+
+
+class QgsMapLayer(QObject):
+
+    legendChanged = pyqtSignal()
+    rendererChanged = pyqtSignal()
+    styleChanged = pyqtSignal()
+    dataChanged = pyqtSignal()
+    nameChanged = pyqtSignal()
+    willBeDeleted = pyqtSignal()
+
+    _next_id = 0
+
+    def __init__(self, name='layer'):
+        super(QgsMapLayer, self).__init__()
+        QgsMapLayer._next_id += 1
+        self._id = '%s_%08d' % (name.replace(' ', '_'), QgsMapLayer._next_id)
+        self._name = name
+        self._opacity = 1.0
+
+    def id(self):
+        return self._id
+
+    def name(self):
+        return self._name
+
+    def opacity(self):
+        return self._opacity
+
+    def setOpacity(self, opacity):
+        self._opacity = opacity
+
+    def triggerRepaint(self, deferred=False):
+        pass
+
+    def styleManager(self):
+        return _StyleManager()
+
+    def isValid(self):
+        return True
+
+
+class _StyleManager:
+
+    def styles(self):
+        return ['default']
+
+    def currentStyle(self):
+        return 'default'
+
+    def setCurrentStyle(self, name):
+        return True
+
+
+class QgsVectorLayer(QgsMapLayer):
+
+    featureAdded = pyqtSignal()
+    featureDeleted = pyqtSignal()
+    attributeValueChanged = pyqtSignal()
+    geometryChanged = pyqtSignal()
+    subsetStringChanged = pyqtSignal()
+
+    def __init__(self, name='layer', renderer=None):
+        super(QgsVectorLayer, self).__init__(name)
+        self._renderer = renderer
+
+    def renderer(self):
+        return self._renderer
+
+    def geometryType(self):
+        return QgsWkbTypes.PolygonGeometry
+
+
+class QgsRasterLayer(QgsMapLayer):
+
+    def renderer(self):
+        return None
+
+
+class _ProjectScope:
+
+    def __init__(self, variables):
+        self._variables = variables
+
+    def variableNames(self):
+        return list(self._variables)
+
+    def variable(self, name):
+        return self._variables.get(name)
+
+    def hasVariable(self, name):
+        return name in self._variables
+
+
+class QgsProject(QObject):
+
+    layersWillBeRemoved = pyqtSignal()
+    layersAdded = pyqtSignal()
+    readProject = pyqtSignal()
+    cleared = pyqtSignal()
+    customVariablesChanged = pyqtSignal()
+
+    _instance = None
+
+    def __init__(self):
+        super(QgsProject, self).__init__()
+        self._root = QgsLayerTreeGroup('')
+        self._layers = {}
+        self.custom_variables = {}
+        self.variable_writes = 0
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = QgsProject()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        cls._instance = QgsProject()
+        return cls._instance
+
+    def layerTreeRoot(self):
+        return self._root
+
+    def addMapLayer(self, layer, add_to_legend=True):
+        self._layers[layer.id()] = layer
+        return layer
+
+    def mapLayer(self, layer_id):
+        return self._layers.get(layer_id)
+
+    def mapLayers(self):
+        return dict(self._layers)
+
+    def customVariables(self):
+        return dict(self.custom_variables)
+
+    def setCustomVariables(self, variables):
+        self.variable_writes += 1
+        self.custom_variables = dict(variables)
+        self.customVariablesChanged.emit()
+
+    def writeEntry(self, scope, key, value):
+        return True
+
+    def setDirty(self, dirty=True):
+        pass
+
+
+class QgsExpressionContextUtils(StubClass):
+
+    @staticmethod
+    def projectScope(project):
+        return _ProjectScope(project.custom_variables)
+
+    @staticmethod
+    def setProjectVariable(project, name, value):
+        variables = project.customVariables()
+        variables[name] = value
+        project.setCustomVariables(variables)
+
+    @staticmethod
+    def setProjectVariables(project, variables):
+        project.setCustomVariables(variables)
+
+    @staticmethod
+    def removeProjectVariable(project, name):
+        variables = project.customVariables()
+        variables.pop(name, None)
+        project.setCustomVariables(variables)
+
+
+class QgsRenderContext(StubClass):
+    pass
+
+
+class QgsMessageLog(StubClass):
+
+    @staticmethod
+    def logMessage(*args, **kwargs):
+        pass
+
+
+class QgsSettings(QSettings):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# uic
+# ---------------------------------------------------------------------------
+
+def _load_ui_type(path):
+    """Build a form class whose setupUi creates fakes for the .ui widgets"""
+    tree = ElementTree.parse(path)
+    widgets = []
+    for element in tree.getroot().iter('widget'):
+        widgets.append((element.get('class'), element.get('name')))
+
+    class FakeForm:
+
+        def setupUi(self, dock):
+            for widget_class, name in widgets[1:]:
+                if widget_class == 'QComboBox':
+                    setattr(dock, name, QComboBox())
+                elif widget_class == 'QSpinBox':
+                    setattr(dock, name, QSpinBox())
+                else:
+                    setattr(dock, name, Stub())
+
+    return FakeForm, object
+
+
+# ---------------------------------------------------------------------------
+# Installation
+# ---------------------------------------------------------------------------
+
+def install():
+    """Register the fake modules in sys.modules (idempotent)"""
+    if 'qgis' in sys.modules and getattr(sys.modules['qgis'], '__fake__', False):
+        return
+
+    this = sys.modules[__name__]
+
+    def pick(*names):
+        return {name: getattr(this, name) for name in names}
+
+    qtcore = _stub_module('qgis.PyQt.QtCore', **pick(
+        'QObject', 'pyqtSignal', 'Qt', 'QSize', 'QModelIndex', 'QTimer', 'QRunnable',
+        'QThreadPool', 'QThread', 'QCoreApplication', 'QSettings', 'QVariant'))
+    qtcore.QAbstractTableModel = type('QAbstractTableModel', (QAbstractItemModel,), {})
+    qtcore.QAbstractListModel = type('QAbstractListModel', (QAbstractItemModel,), {})
+    qtcore.QAbstractItemModel = QAbstractItemModel
+    qtcore.QSortFilterProxyModel = type('QSortFilterProxyModel', (QAbstractItemModel,), {})
+    qtcore.pyqtSlot = lambda *args, **kwargs: (lambda function: function)
+    qtcore.qVersion = lambda: '5.15.0'
+    qtcore.QT_VERSION_STR = '5.15.0'
+
+    qtgui = _stub_module('qgis.PyQt.QtGui', **pick(
+        'QPixmap', 'QImage', 'QColor', 'QFont', 'QIcon', 'QStandardItem', 'QStandardItemModel'))
+
+    qtwidgets = _stub_module('qgis.PyQt.QtWidgets', QDockWidget=type('QDockWidget', (QObject,), {
+        'isVisible': lambda self: True,
+        'devicePixelRatioF': lambda self: 1.0,
+    }), QComboBox=QComboBox, QStyledItemDelegate=type('QStyledItemDelegate', (QObject,), {}))
+
+    uic = _stub_module('qgis.PyQt.uic', loadUiType=_load_ui_type)
+
+    pyqt = _stub_module('qgis.PyQt', QtCore=qtcore, QtGui=qtgui, QtWidgets=qtwidgets, uic=uic)
+    pyqt.__path__ = []
+
+    core = _stub_module('qgis.core', **pick(
+        'QgsLayerTreeNode', 'QgsLayerTreeLayer', 'QgsLayerTreeGroup', 'QgsWkbTypes', 'QgsSymbol',
+        'QgsLegendSymbolItem', 'QgsCategorizedSymbolRenderer', 'QgsSymbolLayerUtils',
+        'QgsMapLayer', 'QgsVectorLayer', 'QgsRasterLayer', 'QgsProject',
+        'QgsExpressionContextUtils', 'QgsRenderContext', 'QgsMessageLog', 'QgsSettings'))
+    core.__all__ = [name for name in vars(core) if name.startswith('Qgs')]
+
+    gui = _stub_module('qgis.gui')
+    gui.__all__ = []
+
+    qgis = _stub_module('qgis', PyQt=pyqt, core=core, gui=gui, __fake__=True)
+    qgis.__path__ = []
+
+    sys.modules.update({
+        'qgis': qgis,
+        'qgis.PyQt': pyqt,
+        'qgis.PyQt.QtCore': qtcore,
+        'qgis.PyQt.QtGui': qtgui,
+        'qgis.PyQt.QtWidgets': qtwidgets,
+        'qgis.PyQt.uic': uic,
+        'qgis.core': core,
+        'qgis.gui': gui,
+        # Never mix a real Qt with the fakes
+        'PyQt5': None,
+        'PyQt6': None,
+    })
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ ClassFeatureIndex
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Legend class -> feature id index, used to select or zoom to a class.
+
+ The index of a layer is built by one pass over its features in a QgsTask
+ and then follows the edits of the layer: added features are classified and
+ appended, deleted ones are masked, and attribute changes on the renderer's
+ fields move a feature to its new class.  Edited features are only noted
+ when the signals arrive and reclassified together, with one renderer and
+ one feature request, the next time the index is read; an edit too large
+ for that (a field calculator run, say) drops the index instead, as does a
+ new data source or a data change outside edit mode.  Bounding
+ boxes only grow, so a zoom after deletions may show a little more than
+ the class.
+"""
+
+from array import array
+
+from qgis.core import QgsFeatureRequest, QgsRectangle
+
+from .qt_compat import pyqtSignal, translate
+from .layer_scan import LayerScanTask, LayerTaskCache, createRenderContext
+
+# Masked ids (deleted or moved) tolerated before the arrays are rewritten
+COMPACT_THRESHOLD = 10000
+# Edited features waiting for reclassification before the index is rebuilt instead
+RECLASSIFY_LIMIT = 5000
+
+
+def _grow(rect, other):
+    """rect enlarged to contain other; either may be None"""
+    if other is None or other.isNull():
+        return rect
+    if rect is None:
+        return QgsRectangle(other)
+    rect.combineExtentWith(other)
+    return rect
+
+
+def _featureBox(feature):
+    if not feature.hasGeometry():
+        return None
+    return feature.geometry().boundingBox()
+
+
+class LayerClassIndex:
+    """Feature ids and bounding box of every legend key of one layer"""
+
+    def __init__(self, fids, boxes, attributes):
+        # legend key -> array('q') of feature ids
+        self.fids = fids
+        # legend key -> QgsRectangle in layer CRS, never shrunk
+        self.boxes = boxes
+        # Field names the renderer classifies on
+        self.attributes = set(attributes)
+        # Ids removed since the build
+        self.deleted = set()
+        # feature id -> legend keys it moved to after an attribute change
+        self.moved = {}
+        # Edited ids waiting for reclassification: added, with a changed
+        # class attribute, with a changed geometry
+        self.dirty_added = set()
+        self.dirty_attributes = set()
+        self.dirty_geometries = set()
+
+    def dirtyCount(self):
+        return len(self.dirty_added) + len(self.dirty_attributes) + len(self.dirty_geometries)
+
+    def featureIds(self, key):
+        fids = self.fids.get(key)
+        if fids is None:
+            return []
+        if not self.deleted and not self.moved:
+            return fids.tolist()
+        deleted, moved = self.deleted, self.moved
+        # A feature moved back and forth may be listed twice
+        return list(dict.fromkeys(
+            fid for fid in fids if fid not in deleted and key in moved.get(fid, (key,))))
+
+    def extent(self, key):
+        return self.boxes.get(key)
+
+    def counts(self):
+        """legend key -> number of features"""
+        if not self.deleted and not self.moved:
+            return {key: len(fids) for key, fids in self.fids.items()}
+        return {key: len(self.featureIds(key)) for key in self.fids}
+
+    def add(self, fid, keys, box):
+        if fid in self.deleted:
+            # Undo of a deletion: the id is still in the arrays of its old class
+            self.deleted.discard(fid)
+            self.move(fid, keys, box)
+            return
+        for key in keys:
+            self.fids.setdefault(key, array('q')).append(fid)
+            self.boxes[key] = _grow(self.boxes.get(key), box)
+
+    def remove(self, fid):
+        self.deleted.add(fid)
+        self.moved.pop(fid, None)
+        self.dirty_added.discard(fid)
+        self.dirty_attributes.discard(fid)
+        self.dirty_geometries.discard(fid)
+
+    def move(self, fid, keys, box):
+        self.moved[fid] = frozenset(keys)
+        for key in keys:
+            self.fids.setdefault(key, array('q')).append(fid)
+            self.boxes[key] = _grow(self.boxes.get(key), box)
+
+    def needsCompacting(self):
+        return len(self.deleted) + len(self.moved) > COMPACT_THRESHOLD
+
+    def compact(self):
+        for key in list(self.fids):
+            self.fids[key] = array('q', self.featureIds(key))
+        self.deleted.clear()
+        self.moved.clear()
+
+
+class ClassIndexTask(LayerScanTask):
+    """Builds the LayerClassIndex of a layer in one pass over its features"""
+
+    def __init__(self, layer, callback):
+        super(ClassIndexTask, self).__init__(
+            translate('LegendView', 'Indexing legend classes of %s') % layer.name(), layer, callback)
+        self.index = None
+
+    def scan(self):
+        fids = {}
+        boxes = {}
+        for feature, keys in self.classify(self.featureRequest()):
+            box = _featureBox(feature)
+            for key in keys:
+                fid_array = fids.get(key)
+                if fid_array is None:
+                    fid_array = fids[key] = array('q')
+                fid_array.append(feature.id())
+                boxes[key] = _grow(boxes.get(key), box)
+        if self.isCanceled():
+            return False
+        self.index = LayerClassIndex(fids, boxes, self._renderer.usedAttributes(self._context))
+        return True
+
+
+class ClassFeatureIndex(LayerTaskCache):
+    """Lazily built class -> feature id indexes, one per layer
+
+    featureIds() and extent() return None until the index of the layer is
+    built; indexReady is emitted with the layer id once it is.
+    """
+
+    indexReady = pyqtSignal(str)
+
+    def __init__(self, project, parent=None):
+        super(ClassFeatureIndex, self).__init__(ClassIndexTask, 'index', project, parent)
+
+    def index(self, layer):
+        """LayerClassIndex of layer, or None while it is being built"""
+        index = self.result(layer)
+        if index is not None and index.dirtyCount():
+            self._reclassify(layer.id(), index)
+        return index
+
+    def featureIds(self, layer, key):
+        index = self.index(layer)
+        return None if index is None else index.featureIds(key)
+
+    def extent(self, layer, key):
+        index = self.index(layer)
+        return None if index is None else index.extent(key)
+
+    def counts(self, layer, build=False):
+        """Feature count per legend key, or None if the index is not built
+
+        The index is only started for the counts when build is True.
+        """
+        if build:
+            index = self.index(layer)
+        else:
+            index = self.cachedResult(layer.id())
+            if index is not None and index.dirtyCount():
+                self._reclassify(layer.id(), index)
+        return None if index is None else index.counts()
+
+    def resultReady(self, layer_id):
+        self.indexReady.emit(layer_id)
+
+    def layerConnections(self, layer):
+        layer_id = layer.id()
+        rebuild = lambda *args: self.invalidate(layer_id)
+        # Outside edit mode the edit signals are silent: a provider reload
+        # or a change written straight to the source only shows here
+        reload = lambda *args: None if layer.isEditable() else self.invalidate(layer_id)
+        return [
+            (layer.featureAdded, lambda fid: self._featureAdded(layer_id, fid)),
+            (layer.featureDeleted, lambda fid: self._featureDeleted(layer_id, fid)),
+            (layer.attributeValueChanged, lambda fid, field, value: self._attributeChanged(layer_id, fid, field)),
+            (layer.geometryChanged, lambda fid, geometry: self._geometryChanged(layer_id, fid, geometry)),
+            # Ids of added features change on commit, and a rollback or a
+            # new filter changes the feature set wholesale
+            (layer.rendererChanged, rebuild),
+            (layer.afterCommitChanges, rebuild),
+            (layer.afterRollBack, rebuild),
+            (layer.subsetStringChanged, rebuild),
+            (layer.dataSourceChanged, rebuild),
+            (layer.dataChanged, reload),
+        ]
+
+    def _reclassify(self, layer_id, index):
+        """Classify every edited feature with one renderer and one request"""
+        layer = self.watchedLayer(layer_id)
+        added, index.dirty_added = index.dirty_added, set()
+        changed, index.dirty_attributes = index.dirty_attributes, set()
+        moved_only, index.dirty_geometries = index.dirty_geometries, set()
+        request = QgsFeatureRequest()
+        request.setFilterFids(list(added | changed | moved_only))
+        renderer = layer.renderer().clone()
+        context = createRenderContext(layer)
+        renderer.startRender(context, layer.fields())
+        try:
+            for feature in layer.getFeatures(request):
+                context.expressionContext().setFeature(feature)
+                keys = renderer.legendKeysForFeature(feature, context)
+                fid = feature.id()
+                box = _featureBox(feature)
+                if fid in added:
+                    index.add(fid, keys, box)
+                elif fid in changed:
+                    index.move(fid, keys, box)
+                else:
+                    for key in keys:
+                        index.boxes[key] = _grow(index.boxes.get(key), box)
+        finally:
+            renderer.stopRender(context)
+        if index.needsCompacting():
+            index.compact()
+
+    def _edited(self, layer_id, dirty, fid):
+        """Note fid in the dirty set named dirty; False if there is no index"""
+        index = self.cachedResult(layer_id)
+        if index is None:
+            if self.isPending(layer_id):
+                # The running scan may or may not see the edit
+                self.invalidate(layer_id)
+            return False
+        getattr(index, dirty).add(fid)
+        if index.dirtyCount() > RECLASSIFY_LIMIT:
+            # Cheaper to scan the layer again than to classify feature by feature
+            self.invalidate(layer_id)
+        return True
+
+    def _featureAdded(self, layer_id, fid):
+        self._edited(layer_id, 'dirty_added', fid)
+
+    def _featureDeleted(self, layer_id, fid):
+        index = self.cachedResult(layer_id)
+        if index is not None:
+            index.remove(fid)
+            if index.needsCompacting():
+                index.compact()
+        elif self.isPending(layer_id):
+            self.invalidate(layer_id)
+
+    def _attributeChanged(self, layer_id, fid, field):
+        index = self.cachedResult(layer_id)
+        if index is not None:
+            fields = self.watchedLayer(layer_id).fields()
+            if 0 <= field < fields.count() and fields.at(field).name() not in index.attributes:
+                # Not a field the renderer classifies on
+                return
+        self._edited(layer_id, 'dirty_attributes', fid)
+
+    def _geometryChanged(self, layer_id, fid, geometry):
+        self._edited(layer_id, 'dirty_geometries', fid)
@@ -6,6 +6,9 @@ Creates a distribution ZIP file for the QGIS Legend View plugin
 """
 
 import os
+import re
+import io
+import hashlib
 import zipfile
 import shutil
 import configparser
@@ -66,6 +69,62 @@ def update_metadata_version_and_changelog(new_version):
 
 
 
+UI_FILE = "legend_view_dockwidget_base.ui"
+UI_FORM_MODULE = "legend_view_dockwidget_ui.py"
+
+# Flat enum names written by pyuic5 and their Qt6 scope (PyQt5 accepts both)
+UI_ENUM_SCOPES = {
+    "QAbstractItemView": {
+        "NoEditTriggers": "EditTrigger", "EditKeyPressed": "EditTrigger",
+        "NoSelection": "SelectionMode", "SingleSelection": "SelectionMode",
+    },
+    "QFrame": {"NoFrame": "Shape", "StyledPanel": "Shape"},
+    "QSizePolicy": {"Fixed": "Policy", "Preferred": "Policy", "Expanding": "Policy"},
+}
+
+
+def compile_ui_form(ui_path=UI_FILE, output_path=UI_FORM_MODULE):
+    """Compile the .ui file into a Python form module usable with Qt5 and Qt6
+
+    The module imports Qt through qgis.PyQt and uses scoped enums, so the
+    same file works in both QGIS builds.  It records the SHA-1 of the .ui
+    it was built from; the plugin falls back to uic.loadUiType when the
+    .ui has changed since.
+    """
+    try:
+        from PyQt6 import uic
+    except ImportError:
+        try:
+            from PyQt5 import uic
+        except ImportError:
+            print("⚠ PyQt uic not available, skipping compiled UI form (runtime loadUiType is used)")
+            return False
+
+    with open(ui_path, 'rb') as f:
+        ui_sha1 = hashlib.sha1(f.read()).hexdigest()
+
+    buffer = io.StringIO()
+    with open(ui_path, 'r', encoding='utf-8') as f:
+        uic.compileUi(f, buffer)
+    source = buffer.getvalue()
+
+    source = re.sub(r"^from PyQt[56] import (.*)$", r"from qgis.PyQt import \1", source, flags=re.M)
+    source = re.sub(r"^from qgsopacitywidget import QgsOpacityWidget$",
+                    "from qgis.gui import QgsOpacityWidget", source, flags=re.M)
+    for cls, members in UI_ENUM_SCOPES.items():
+        for member, scope in members.items():
+            source = re.sub(r"QtWidgets\.%s\.%s\b" % (cls, member),
+                            "QtWidgets.%s.%s.%s" % (cls, scope, member), source)
+
+    header = ("# -*- coding: utf-8 -*-\n"
+              "# Generated by create_zip.py from %s - do not edit.\n"
+              "UI_SOURCE_SHA1 = '%s'\n\n" % (ui_path, ui_sha1))
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(header + source)
+    print(f"✓ Compiled UI form: {output_path}")
+    return True
+
+
 def create_plugin_zip():
     """Create ZIP package for QGIS plugin distribution (auto version up)"""
     # 1. get plugin name and version
@@ -75,12 +134,28 @@ def create_plugin_zip():
     update_metadata_version_and_changelog(new_version)
     # 3. ZIP名（QGIS-legendView-main_vX.Y.Z.zip 形式に自動対応）
     zip_name = f"{plugin_folder_name}_v{new_version}.zip"
+    # Precompiled UI form so the plugin does not parse the .ui at runtime
+    compile_ui_form()
     # 4. 必要最小限ファイル
     files_to_include = [
         "__init__.py",
         "legend_view.py",
         "legend_view_dockwidget.py",
+        "legend_model.py",
+        "preview_cache.py",
+        "preview_renderer.py",
+        "layer_path_index.py",
+        "legend_refresh.py",
+        "legend_order.py",
+        "layer_combo_model.py",
+        "legend_variables_dialog.py",
+        "profiling.py",
+        "visible_classes.py",
+        "feature_counts.py",
+        "class_index.py",
+        "layer_scan.py",
         "legend_view_dockwidget_base.ui",
+        UI_FORM_MODULE,
         "resources_rc.py",
         "resources_rc_qt5.py",
         "metadata.txt",
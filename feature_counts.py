@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ FeatureCountCache
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Feature counts per legend class, computed in a QgsTask.
+
+ Categorized layers stored in a GeoPackage or SpatiaLite table are counted
+ with one GROUP BY query on the file; everything else with a single pass
+ over the features, asking the renderer for the legend keys of each one.
+ When the class index of the layer is already built, the counts are taken
+ from it instead.  Layers in edit mode are always counted from the class
+ index, which follows the edits feature by feature, so an edit does not
+ cost a new pass over the layer.
+"""
+
+import sqlite3
+from urllib.parse import quote
+
+from qgis.core import QgsDataSourceUri, QgsFeatureRequest, QgsProviderRegistry
+
+from .qt_compat import QVariant, pyqtSignal, translate
+from .layer_scan import LayerScanTask, LayerTaskCache
+from .legend_refresh import LegendRefreshScheduler
+
+
+def _quoteIdentifier(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _valueKey(value):
+    """String form of a value as QVariant.toString() gives it (NULL -> '')"""
+    if value is None or isinstance(value, QVariant):
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def groupByQuery(layer, renderer):
+    """(database path, SQL, value -> legend key, key for other values) or None
+
+    Only for a categorized renderer on a plain field of an unfiltered
+    GeoPackage or SpatiaLite table; other layers are counted by a scan.
+    The query reads the file, so layers in edit mode are scanned too: their
+    uncommitted changes are only visible through the feature source.
+    """
+    if renderer.type() != 'categorizedSymbol' or layer.subsetString():
+        return None
+    if layer.isEditable() or (layer.editBuffer() is not None and layer.editBuffer().isModified()):
+        return None
+    field = renderer.classAttribute()
+    if layer.fields().lookupField(field) < 0:
+        # An expression, not a field
+        return None
+
+    provider = layer.providerType()
+    if provider == 'ogr':
+        parts = QgsProviderRegistry.instance().decodeUri(provider, layer.source())
+        path = parts.get('path') or ''
+        table = parts.get('layerName')
+        if not path.lower().endswith('.gpkg') or not table:
+            return None
+    elif provider == 'spatialite':
+        uri = QgsDataSourceUri(layer.source())
+        path, table = uri.database(), uri.table()
+        if uri.sql():
+            return None
+    else:
+        return None
+
+    # Categories and their legend items come in the same order
+    categories = renderer.categories()
+    items = renderer.legendSymbolItems()
+    if len(categories) != len(items):
+        return None
+    keys = {}
+    other_key = None
+    for category, item in zip(categories, items):
+        values = category.value()
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            value_key = _valueKey(value)
+            if value_key == '':
+                other_key = item.ruleKey()
+            keys.setdefault(value_key, item.ruleKey())
+
+    sql = 'SELECT %s, COUNT(*) FROM %s GROUP BY %s' % (
+        _quoteIdentifier(field), _quoteIdentifier(table), _quoteIdentifier(field))
+    return path, sql, keys, other_key
+
+
+class FeatureCountTask(LayerScanTask):
+    """Counts the features of every legend key of a layer"""
+
+    def __init__(self, layer, callback):
+        super(FeatureCountTask, self).__init__(
+            translate('LegendView', 'Counting features of %s') % layer.name(), layer, callback)
+        # legend key -> feature count
+        self.counts = {}
+        self._group_by = groupByQuery(layer, self._renderer)
+
+    def run(self):
+        if self._group_by is not None:
+            try:
+                self.counts = self._countGroupBy()
+                return True
+            except sqlite3.Error:
+                # Locked or unexpected schema: fall back to the scan
+                pass
+        return super(FeatureCountTask, self).run()
+
+    def _countGroupBy(self):
+        path, sql, keys, other_key = self._group_by
+        counts = {}
+        connection = sqlite3.connect('file:%s?mode=ro' % quote(path), uri=True)
+        try:
+            for value, count in connection.execute(sql):
+                key = keys.get(_valueKey(value), other_key)
+                if key is not None:
+                    counts[key] = counts.get(key, 0) + count
+        finally:
+            connection.close()
+        return counts
+
+    def scan(self):
+        counts = {}
+        request = self.featureRequest()
+        if not self._renderer.filterNeedsGeometry():
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        for feature, keys in self.classify(request):
+            for key in keys:
+                counts[key] = counts.get(key, 0) + 1
+        if self.isCanceled():
+            return False
+        self.counts = counts
+        return True
+
+
+class FeatureCountCache(LayerTaskCache):
+    """Feature counts per layer, kept until the layer's data or renderer changes
+
+    counts() returns None while the counts are being computed and emits
+    countsChanged with the layer id when they are ready.  With a
+    class_index (a ClassFeatureIndex), layers whose index is built, and
+    layers in edit mode, are counted from it.  Without one, recounts of a
+    layer in edit mode wait until its edits pause.
+    """
+
+    countsChanged = pyqtSignal(str)
+
+    def __init__(self, project, parent=None, class_index=None):
+        super(FeatureCountCache, self).__init__(FeatureCountTask, 'counts', project, parent)
+        self._class_index = class_index
+        if class_index is not None:
+            class_index.indexReady.connect(self.countsChanged.emit)
+        # Ids of edited layers whose counts are dropped once the edits pause
+        self._edited = set()
+        self._editScheduler = LegendRefreshScheduler(self._flushEdited, parent=self)
+
+    def counts(self, layer):
+        """legend key -> feature count, or None while being counted"""
+        if self._class_index is not None and layer is not None:
+            counts = self._class_index.counts(layer, build=layer.isEditable())
+            if counts is not None or layer.isEditable():
+                # Still follow the layer, so edits refresh the labels
+                self._watch(layer)
+                return counts
+        return self.result(layer)
+
+    def layerConnections(self, layer):
+        layer_id = layer.id()
+        slot = lambda *args: self._layerChanged(layer_id)
+        # Counts taken during the edit session are not kept past it
+        stopped = lambda *args: self._editingStopped(layer_id)
+        return [(layer.dataChanged, slot), (layer.rendererChanged, slot),
+                (layer.editingStopped, stopped)]
+
+    def resultReady(self, layer_id):
+        self.countsChanged.emit(layer_id)
+
+    def _layerChanged(self, layer_id):
+        layer = self.watchedLayer(layer_id)
+        if layer is not None and layer.isEditable():
+            if self._class_index is None:
+                self._edited.add(layer_id)
+                self._editScheduler.schedule()
+                return
+            # Counted from the class index, which is patched per feature
+            self.countsChanged.emit(layer_id)
+            return
+        self.invalidate(layer_id)
+        self.countsChanged.emit(layer_id)
+
+    def _editingStopped(self, layer_id):
+        self._edited.discard(layer_id)
+        self.invalidate(layer_id)
+        self.countsChanged.emit(layer_id)
+
+    def _flushEdited(self):
+        edited, self._edited = self._edited, set()
+        for layer_id in edited:
+            self.invalidate(layer_id)
+            self.countsChanged.emit(layer_id)
@@ -1,7 +1,20 @@
 FORMS = ../legend_view_dockwidget_base.ui
 
 SOURCES = ../legend_view.py \
-          ../legend_view_dockwidget.py
+          ../legend_view_dockwidget.py \
+          ../legend_model.py \
+          ../preview_cache.py \
+          ../preview_renderer.py \
+          ../layer_path_index.py \
+          ../legend_refresh.py \
+          ../legend_order.py \
+          ../layer_combo_model.py \
+          ../legend_variables_dialog.py \
+          ../profiling.py \
+          ../visible_classes.py \
+          ../feature_counts.py \
+          ../class_index.py \
+          ../layer_scan.py
 
 TRANSLATIONS = LegendView_ja.ts \
                LegendView_en.ts
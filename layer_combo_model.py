@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LayerComboModel
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Item model behind the layer combo box of the dock.
+"""
+
+from difflib import SequenceMatcher
+
+from qgis.PyQt.QtGui import QStandardItem, QStandardItemModel
+
+from .qt_compat import UserRole
+
+
+class LayerComboModel(QStandardItemModel):
+    """Layers listed in the combo box, one item per entry
+
+    Each item holds its layer id in UserRole.  setEntries() diffs the new
+    entries against the current rows, so registering a layer inserts one
+    row instead of clearing and refilling the combo box.  rowForLayer() is a
+    dict lookup; the index is rebuilt lazily after rows move.
+    """
+
+    def __init__(self, parent=None):
+        super(LayerComboModel, self).__init__(parent)
+        # layer id -> first row listing the layer; None when rows have moved
+        self._rows = None
+        self.rowsInserted.connect(self._invalidateRows)
+        self.rowsRemoved.connect(self._invalidateRows)
+        self.rowsMoved.connect(self._invalidateRows)
+        self.modelReset.connect(self._invalidateRows)
+
+    def setEntries(self, entries):
+        """Update the rows to entries, a list of (layer id, text, icon)
+
+        Returns the number of rows inserted, removed or renamed.
+        """
+        old_ids = [self.layerId(row) for row in range(self.rowCount())]
+        new_ids = [entry[0] for entry in entries]
+        matcher = SequenceMatcher(None, old_ids, new_ids, autojunk=False)
+
+        touched = 0
+        # Back to front so the positions of earlier opcodes stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                for offset in range(i2 - i1):
+                    item = self.item(i1 + offset)
+                    text = entries[j1 + offset][1]
+                    if item.text() != text:
+                        item.setText(text)
+                        touched += 1
+                continue
+
+            if i2 > i1:
+                self.removeRows(i1, i2 - i1)
+            for offset, (layer_id, text, icon) in enumerate(entries[j1:j2]):
+                self.insertRow(i1 + offset, self._createItem(layer_id, text, icon))
+            touched += (i2 - i1) + (j2 - j1)
+            self._rows = None
+        return touched
+
+    def rowForLayer(self, layer_id):
+        """Row of the first entry for layer_id, or -1"""
+        if self._rows is None:
+            self._rows = {}
+            for row in range(self.rowCount()):
+                self._rows.setdefault(self.layerId(row), row)
+        return self._rows.get(layer_id, -1)
+
+    def layerId(self, row):
+        item = self.item(row)
+        return None if item is None else item.data(UserRole)
+
+    def _invalidateRows(self, *args):
+        self._rows = None
+
+    def _createItem(self, layer_id, text, icon):
+        item = QStandardItem(text)
+        if icon is not None:
+            item.setIcon(icon)
+        item.setData(layer_id, UserRole)
+        item.setEditable(False)
+        return item
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LayerPathIndex
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Indexes of the layer tree used to resolve legend_ project variables.
+
+ LayerPathIndex walks the tree once and flattens it in pre-order.  Each
+ group keeps the pre-order range of its descendants, so
+ QgsLayerTreeGroup.findGroup (first matching descendant group) becomes a
+ bisect over the positions of groups with that name instead of a tree walk.
+
+ LayerPathMap keeps the tree path of every layer and is patched in place
+ from the layer-tree signals.
+"""
+
+from bisect import bisect_right
+
+from qgis.PyQt.QtCore import QObject
+from qgis.core import QgsProject, QgsLayerTreeGroup, QgsLayerTreeLayer, QgsMapLayer
+
+
+class _GroupEntry:
+
+    __slots__ = ('name', 'position', 'end', 'layers')
+
+    def __init__(self, name, position):
+        self.name = name
+        # Pre-order position of this group and the end of its subtree
+        self.position = position
+        self.end = position + 1
+        # node name -> layer of the first direct child layer with that name
+        self.layers = {}
+
+
+class LayerPathIndex(QObject):
+    """Resolves 'group_group_layer' paths against the layer tree
+
+    The index is rebuilt lazily: layer-tree signals only mark it dirty, so a
+    burst of tree edits costs a single walk on the next lookup.
+    """
+
+    def __init__(self, root, parent=None, paths=None):
+        super(LayerPathIndex, self).__init__(parent)
+        self._root = root
+        # Full tree paths, shared with registration when given
+        self._paths = paths if paths is not None else LayerPathMap(root, self)
+        self._dirty = True
+        self._root_entry = None
+        self._groups = []
+        # group name -> sorted pre-order positions of groups with that name
+        self._group_positions = {}
+        # variable path -> resolved layer (None for misses)
+        self._resolved = {}
+        self.rebuilds = 0
+
+        root.addedChildren.connect(self.invalidate)
+        root.removedChildren.connect(self.invalidate)
+        root.nameChanged.connect(self.invalidate)
+
+    def invalidate(self, *args):
+        self._dirty = True
+        self._resolved.clear()
+
+    def resolve(self, layer_path):
+        """Return the layer for a legend_ variable path, or None
+
+        Same semantics as splitting the path at every underscore: the leading
+        tokens are group names looked up with findGroup, the rest is the name
+        of a direct child layer.  Paths whose group names contain underscores
+        are matched against the full tree path as a fallback.
+        """
+        if not layer_path:
+            return None
+        self._ensureIndex()
+
+        try:
+            return self._resolved[layer_path]
+        except KeyError:
+            pass
+
+        layer = None
+        tokens = layer_path.split('_')
+        for i in range(0, len(tokens)):
+            entry = self._root_entry
+            for group in tokens[:i]:
+                entry = self._findGroup(entry, group)
+                if entry is None:
+                    break
+            if entry is None:
+                continue
+            candidate = entry.layers.get('_'.join(tokens[i:]))
+            if isinstance(candidate, QgsMapLayer):
+                layer = candidate
+                break
+
+        if layer is None:
+            layer_id = self._paths.layerId(layer_path)
+            if layer_id is not None:
+                layer = QgsProject.instance().mapLayer(layer_id)
+
+        self._resolved[layer_path] = layer
+        return layer
+
+    def _findGroup(self, entry, name):
+        positions = self._group_positions.get(name)
+        if not positions:
+            return None
+        i = bisect_right(positions, entry.position)
+        if i < len(positions) and positions[i] < entry.end:
+            return self._groups[positions[i]]
+        return None
+
+    def _ensureIndex(self):
+        if not self._dirty:
+            return
+        self._groups = []
+        self._group_positions = {}
+        self._root_entry = self._addGroup('')
+        self._walk(self._root, self._root_entry)
+        self._dirty = False
+        self.rebuilds += 1
+
+    def _addGroup(self, name):
+        entry = _GroupEntry(name, len(self._groups))
+        self._groups.append(entry)
+        return entry
+
+    def _walk(self, node, entry):
+        for child in node.children():
+            if isinstance(child, QgsLayerTreeLayer):
+                name = child.name()
+                if name not in entry.layers:
+                    entry.layers[name] = child.layer()
+            elif isinstance(child, QgsLayerTreeGroup):
+                name = child.name()
+                child_entry = self._addGroup(name)
+                self._group_positions.setdefault(name, []).append(child_entry.position)
+                self._walk(child, child_entry)
+                child_entry.end = len(self._groups)
+        entry.end = len(self._groups)
+
+
+class LayerPathMap(QObject):
+    """Layer id -> tree path (group names, then the layer node name)
+
+    Built by one walk on first use, then patched from addedChildren,
+    willRemoveChildren and nameChanged: only the subtree that changed is
+    visited.  A layer listed twice keeps the path of its first node.
+    """
+
+    def __init__(self, root, parent=None):
+        super(LayerPathMap, self).__init__(parent)
+        self._root = root
+        self._dirty = True
+        # layer id -> list of names
+        self._paths = {}
+        # '_'-joined path -> layer id
+        self._layer_ids = {}
+        # Layers of nodes being removed, re-located once they are gone
+        self._removed = []
+        self.rebuilds = 0
+        self.updates = 0
+
+        root.addedChildren.connect(self._addedChildren)
+        root.willRemoveChildren.connect(self._willRemoveChildren)
+        root.removedChildren.connect(self._removedChildren)
+        root.nameChanged.connect(self._nameChanged)
+
+    def invalidate(self, *args):
+        """Drop everything; the next lookup walks the whole tree again"""
+        self._dirty = True
+
+    def path(self, layer_id):
+        """Tree path of the layer as a list of names, or None"""
+        self._ensureMap()
+        path = self._paths.get(layer_id)
+        return None if path is None else list(path)
+
+    def layerId(self, joined_path):
+        """Id of the layer whose '_'-joined tree path is joined_path, or None"""
+        self._ensureMap()
+        return self._layer_ids.get(joined_path)
+
+    def _ensureMap(self):
+        if not self._dirty:
+            return
+        self._paths = {}
+        self._layer_ids = {}
+        for child in self._root.children():
+            self._addNode(child, [])
+        self._dirty = False
+        self.rebuilds += 1
+
+    def _prefix(self, node):
+        """Group names from the root (excluded) down to node (included)"""
+        names = []
+        while node is not None and node.parent() is not None:
+            names.append(node.name())
+            node = node.parent()
+        names.reverse()
+        return names
+
+    def _addNode(self, node, prefix):
+        if isinstance(node, QgsLayerTreeLayer):
+            path = prefix + [node.name()]
+            layer_id = node.layerId()
+            if layer_id not in self._paths:
+                self._paths[layer_id] = path
+            self._layer_ids.setdefault('_'.join(path), layer_id)
+        elif isinstance(node, QgsLayerTreeGroup):
+            prefix = prefix + [node.name()]
+            for child in node.children():
+                self._addNode(child, prefix)
+
+    def _removeNode(self, node, removed):
+        if isinstance(node, QgsLayerTreeLayer):
+            layer_id = node.layerId()
+            path = self._paths.pop(layer_id, None)
+            if path is not None:
+                joined = '_'.join(path)
+                if self._layer_ids.get(joined) == layer_id:
+                    del self._layer_ids[joined]
+                removed.append(layer_id)
+        elif isinstance(node, QgsLayerTreeGroup):
+            for child in node.children():
+                self._removeNode(child, removed)
+
+    def _relocate(self, layer_ids):
+        """Add back layers that are still in the tree under another node"""
+        for layer_id in layer_ids:
+            node = self._root.findLayer(layer_id)
+            if node is not None:
+                self._addNode(node, self._prefix(node.parent()))
+
+    def _addedChildren(self, node, index_from, index_to):
+        if self._dirty:
+            return
+        prefix = self._prefix(node)
+        children = node.children()
+        for child in children[index_from:index_to + 1]:
+            self._addNode(child, prefix)
+        self.updates += 1
+
+    def _willRemoveChildren(self, node, index_from, index_to):
+        if self._dirty:
+            return
+        children = node.children()
+        for child in children[index_from:index_to + 1]:
+            self._removeNode(child, self._removed)
+        self.updates += 1
+
+    def _removedChildren(self, node, index_from, index_to):
+        removed, self._removed = self._removed, []
+        if not self._dirty:
+            self._relocate(removed)
+
+    def _nameChanged(self, node, name):
+        if self._dirty:
+            return
+        removed = []
+        self._removeNode(node, removed)
+        self._addNode(node, self._prefix(node.parent()))
+        self.updates += 1
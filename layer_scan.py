@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LayerScanTask
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Shared pieces of the background passes over a vector layer's features:
+ LayerScanTask classifies features into legend keys in a QgsTask, and
+ LayerTaskCache keeps one task result per layer until the layer changes.
+"""
+
+from qgis.PyQt.QtCore import QObject
+from qgis.core import (QgsApplication, QgsExpressionContextUtils, QgsFeatureRequest,
+                       QgsRenderContext, QgsTask, QgsVectorLayer, QgsVectorLayerFeatureSource)
+
+# Features between two cancellation checks
+CANCEL_CHECK_INTERVAL = 1000
+
+
+def createRenderContext(layer):
+    """Render context with the global, project and layer expression scopes"""
+    context = QgsRenderContext()
+    context.expressionContext().appendScopes(
+        QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+    return context
+
+
+class LayerScanTask(QgsTask):
+    """Base for tasks that sort a layer's features into legend keys
+
+    Everything the scan needs (feature source, renderer clone, expression
+    scopes) is taken from the layer on the GUI thread; run() only touches
+    these copies.  Subclasses define scan(), which runs between startRender
+    and stopRender and returns False when canceled, and read their result
+    in the callback called from finished().
+    """
+
+    def __init__(self, description, layer, callback):
+        super(LayerScanTask, self).__init__(description, QgsTask.CanCancel)
+        self.layer_id = layer.id()
+        self._callback = callback
+        self._source = QgsVectorLayerFeatureSource(layer)
+        self._fields = layer.fields()
+        self._renderer = layer.renderer().clone()
+        self._context = createRenderContext(layer)
+
+    def run(self):
+        self._renderer.startRender(self._context, self._fields)
+        try:
+            return self.scan()
+        finally:
+            self._renderer.stopRender(self._context)
+
+    def featureRequest(self):
+        """Request fetching only the attributes the renderer uses"""
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes(self._renderer.usedAttributes(self._context), self._fields)
+        return request
+
+    def classify(self, request):
+        """Yield (feature, legend keys) for request, stopping when canceled
+
+        Callers check isCanceled() after the loop.
+        """
+        context = self._context
+        renderer = self._renderer
+        for number, feature in enumerate(self._source.getFeatures(request)):
+            if number % CANCEL_CHECK_INTERVAL == 0 and self.isCanceled():
+                return
+            context.expressionContext().setFeature(feature)
+            yield feature, renderer.legendKeysForFeature(feature, context)
+
+    def finished(self, result):
+        self._callback(self, result)
+
+
+class LayerTaskCache(QObject):
+    """One LayerScanTask result per vector layer
+
+    result() starts a task_class(layer, callback) on first use and returns
+    None until it has finished; the task's result_attribute is then kept
+    and resultReady() is called with the layer id.  Results are
+    dropped with invalidate(), which subclasses call from the layer signals
+    they connect in layerConnections().
+    """
+
+    def __init__(self, task_class, result_attribute, project, parent=None):
+        super(LayerTaskCache, self).__init__(parent)
+        self._task_class = task_class
+        self._result_attribute = result_attribute
+        # layer id -> task result
+        self._results = {}
+        # layer id -> running task
+        self._tasks = {}
+        # layer id -> (layer, [(signal, slot)])
+        self._layers = {}
+        project.layersWillBeRemoved.connect(self._layersWillBeRemoved)
+
+    def layerConnections(self, layer):
+        """[(signal, slot)] connected while results of layer are kept"""
+        layer_id = layer.id()
+        return [(layer.rendererChanged, lambda *args: self.invalidate(layer_id))]
+
+    def resultReady(self, layer_id):
+        """Called when the task of layer_id has finished"""
+
+    def result(self, layer):
+        if not isinstance(layer, QgsVectorLayer) or layer.renderer() is None:
+            return None
+        layer_id = layer.id()
+        result = self._results.get(layer_id)
+        if result is None and layer_id not in self._tasks:
+            self._watch(layer)
+            task = self._task_class(layer, self._taskFinished)
+            self._tasks[layer_id] = task
+            QgsApplication.taskManager().addTask(task)
+        return result
+
+    def cachedResult(self, layer_id):
+        """Result of layer_id if there is one, without starting a task"""
+        return self._results.get(layer_id)
+
+    def isPending(self, layer_id):
+        return layer_id in self._tasks
+
+    def watchedLayer(self, layer_id):
+        watched = self._layers.get(layer_id)
+        return None if watched is None else watched[0]
+
+    def invalidate(self, layer_id):
+        self._results.pop(layer_id, None)
+        task = self._tasks.pop(layer_id, None)
+        if task is not None:
+            try:
+                task.cancel()
+            except RuntimeError:
+                # Already deleted by the task manager
+                pass
+
+    def clear(self):
+        for layer_id in list(self._layers):
+            self._unwatch(layer_id)
+            self.invalidate(layer_id)
+
+    def _watch(self, layer):
+        if layer.id() in self._layers:
+            return
+        connections = self.layerConnections(layer)
+        for signal, slot in connections:
+            signal.connect(slot)
+        self._layers[layer.id()] = (layer, connections)
+
+    def _unwatch(self, layer_id):
+        watched = self._layers.pop(layer_id, None)
+        if watched is None:
+            return
+        for signal, slot in watched[1]:
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+
+    def _taskFinished(self, task, result):
+        if self._tasks.get(task.layer_id) is not task:
+            return
+        del self._tasks[task.layer_id]
+        if result:
+            self._results[task.layer_id] = getattr(task, self._result_attribute)
+            self.resultReady(task.layer_id)
+
+    def _layersWillBeRemoved(self, layer_ids):
+        for layer_id in layer_ids:
+            self._unwatch(layer_id)
+            self.invalidate(layer_id)
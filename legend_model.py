@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LegendTableModel
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Model/view classes for the legend table and the raster legend list.  The
+ views only ask the models for the rows that are on screen, so symbol
+ previews and color swatches are rendered lazily and no per-row widgets
+ are created.
+"""
+
+from difflib import SequenceMatcher
+
+from qgis.PyQt.QtCore import QAbstractTableModel, QAbstractListModel, QModelIndex, QRect
+from qgis.PyQt.QtGui import QColor
+from qgis.PyQt.QtWidgets import QApplication, QStyledItemDelegate, QStyleOptionViewItem
+
+from .qt_compat import (QSize, QFont, QPixmap, pyqtSignal, translate,
+                        DisplayRole, DecorationRole, FontRole, CheckStateRole, Horizontal,
+                        ItemIsUserCheckable, Checked, Unchecked,
+                        PE_IndicatorItemViewItemCheck, SE_ItemViewItemCheckIndicator)
+from .preview_cache import sharedPreviewCache, symbolKey, renderPreview
+
+
+class LegendRow:
+    """One legend entry shown in the table"""
+
+    __slots__ = ('key', 'symbol', 'label', 'checked', '_symbol_key', '_owner')
+
+    def __init__(self, symbol, label, key=None, owner=None, checked=None):
+        # Renderer rule key; identifies the row across legend updates
+        self.key = key
+        self.symbol = symbol
+        self.label = label
+        # Class visibility, or None if the renderer cannot toggle classes
+        self.checked = checked
+        self._symbol_key = None
+        # Object that owns symbol (a QgsLegendSymbolItem), kept alive with the row
+        self._owner = owner
+
+    def symbolKey(self):
+        """Hash of the symbol definition, computed once per row"""
+        if self._symbol_key is None and self.symbol is not None:
+            self._symbol_key = symbolKey(self.symbol)
+        return self._symbol_key
+
+    def isOther(self):
+        """Empty labels are the catch-all "Other values" category"""
+        return not bool(self.label)
+
+    def sameContent(self, other):
+        return (self.label == other.label and self.checked == other.checked
+                and self.symbolKey() == other.symbolKey())
+
+
+def extractLegendRows(renderer):
+    """Build the legend rows with a single walk of legendSymbolItems()
+
+    Symbol, label and rule key all come from the same legend item, so the
+    rows line up for every renderer type (including rule-based renderers,
+    where renderer.symbols() does not match the legend order).
+    """
+    if renderer is None:
+        return []
+    checkable = renderer.legendSymbolItemsCheckable()
+    rows = []
+    for item in renderer.legendSymbolItems():
+        key = item.ruleKey()
+        checked = renderer.legendSymbolItemChecked(key) if checkable else None
+        rows.append(LegendRow(item.symbol(), item.label(), key, item, checked))
+    return rows
+
+
+class LegendTableModel(QAbstractTableModel):
+    """Table model with a Symbol and a Legend column"""
+
+    SYMBOL_COLUMN = 0
+    LEGEND_COLUMN = 1
+
+    # Id of the layer whose class visibility was changed through the model
+    checkStatesChanged = pyqtSignal(str)
+
+    def __init__(self, parent=None, preview_cache=None, preview_renderer=None):
+        super(LegendTableModel, self).__init__(parent)
+        self._rows = []
+        self._icon_size = QSize(55, 16)
+        self._device_pixel_ratio = 1.0
+        self._preview_cache = preview_cache if preview_cache is not None else sharedPreviewCache()
+        self._placeholder = None
+        # cache key -> rows showing a placeholder until the render arrives
+        self._waiting_rows = {}
+        self._preview_renderer = preview_renderer
+        if preview_renderer is not None:
+            preview_renderer.imageRendered.connect(self._previewRendered)
+        self._headers = [translate('LegendView', 'Symbol'), translate('LegendView', 'Legend')]
+        self._other_font = QFont()
+        self._other_font.setItalic(True)
+        # legend key -> feature count, or None when counts are not shown
+        self._feature_counts = None
+        # Vector layer whose renderer holds the check states of the rows
+        self._check_layer = None
+
+    def setHeaderLabels(self, labels):
+        self._headers = list(labels)
+        self.headerDataChanged.emit(Horizontal, 0, len(self._headers) - 1)
+
+    def setIconSize(self, size: QSize, device_pixel_ratio=1.0):
+        """Set the preview size and the device pixel ratio of the view"""
+        if size == self._icon_size and device_pixel_ratio == self._device_pixel_ratio:
+            return
+        self._icon_size = QSize(size)
+        self._device_pixel_ratio = device_pixel_ratio
+        self._placeholder = None
+        if self._rows:
+            self.dataChanged.emit(self.index(0, self.SYMBOL_COLUMN),
+                                  self.index(len(self._rows) - 1, self.SYMBOL_COLUMN))
+
+    def iconSize(self):
+        return QSize(self._icon_size)
+
+    def previewCache(self):
+        return self._preview_cache
+
+    def setLegend(self, rows):
+        """Replace the displayed rows with a list of LegendRow"""
+        self.cancelPreviews()
+        self.beginResetModel()
+        self._rows = list(rows)
+        self.endResetModel()
+
+    def setFeatureCounts(self, counts):
+        """Show "label [n]" from counts (legend key -> count); None hides them"""
+        if counts == self._feature_counts:
+            return
+        self._feature_counts = counts
+        if self._rows:
+            self.dataChanged.emit(self.index(0, self.LEGEND_COLUMN),
+                                  self.index(len(self._rows) - 1, self.LEGEND_COLUMN))
+
+    def setCheckLayer(self, layer):
+        """Read and toggle class visibility through the renderer of layer"""
+        self._check_layer = layer
+
+    def setChecked(self, keys, checked):
+        """Show (checked) or hide every class in keys; returns the number changed
+
+        keys are legend keys of the check layer's renderer, shown in the
+        table or not.
+        """
+        return self._applyCheckStates([(key, checked) for key in keys])
+
+    def invertChecked(self, keys):
+        renderer = self._checkRenderer()
+        if renderer is None:
+            return 0
+        return self._applyCheckStates([(key, not renderer.legendSymbolItemChecked(key)) for key in keys])
+
+    def _checkRenderer(self):
+        layer = self._check_layer
+        renderer = layer.renderer() if layer is not None else None
+        if renderer is None or not renderer.legendSymbolItemsCheckable():
+            return None
+        return renderer
+
+    def _applyCheckStates(self, states):
+        """Apply (legend key, checked) pairs as one batch
+
+        The renderer is updated for every class first; the view and the
+        layer are then notified once, with one dataChanged over the rows
+        shown and one checkStatesChanged, however many classes changed.
+        """
+        renderer = self._checkRenderer()
+        if renderer is None:
+            return 0
+        changed = {}
+        for key, checked in states:
+            if renderer.legendSymbolItemChecked(key) != checked:
+                renderer.checkLegendSymbolItem(key, checked)
+                changed[key] = checked
+        if not changed:
+            return 0
+        rows = []
+        for row_index, row in enumerate(self._rows):
+            if row.checked is not None and row.key in changed:
+                row.checked = changed[row.key]
+                rows.append(row_index)
+        if rows:
+            self.dataChanged.emit(self.index(rows[0], self.SYMBOL_COLUMN),
+                                  self.index(rows[-1], self.SYMBOL_COLUMN))
+        self.checkStatesChanged.emit(self._check_layer.id())
+        return len(changed)
+
+    def cancelPreviews(self):
+        """Stop waiting for renders requested for the rows shown so far"""
+        self._waiting_rows.clear()
+        if self._preview_renderer is not None:
+            self._preview_renderer.cancel()
+
+    def updateLegend(self, rows):
+        """Update the displayed rows in place, touching only what changed
+
+        Rows are matched by rule key.  Inserted and removed classes become
+        row insertions/removals, so the view keeps its scroll position, and
+        only rows whose label or symbol hash changed emit dataChanged.
+        """
+        rows = list(rows)
+        if not self._rows:
+            self.setLegend(rows)
+            return
+
+        # Row numbers of outstanding previews shift with the edit; let the
+        # view ask again for whatever is still visible
+        had_waiting = bool(self._waiting_rows)
+        self._waiting_rows.clear()
+
+        matcher = SequenceMatcher(None, [row.key for row in self._rows],
+                                  [row.key for row in rows], autojunk=False)
+        # Apply from the end so the positions of earlier opcodes stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                self._updateRows(i1, rows[j1:j2])
+                continue
+            if i2 > i1:
+                self.beginRemoveRows(QModelIndex(), i1, i2 - 1)
+                del self._rows[i1:i2]
+                self.endRemoveRows()
+            if j2 > j1:
+                self.beginInsertRows(QModelIndex(), i1, i1 + (j2 - j1) - 1)
+                self._rows[i1:i1] = rows[j1:j2]
+                self.endInsertRows()
+
+        if had_waiting and self._rows:
+            self.dataChanged.emit(self.index(0, self.SYMBOL_COLUMN),
+                                  self.index(len(self._rows) - 1, self.SYMBOL_COLUMN))
+
+    def _updateRows(self, start, new_rows):
+        changed_from = None
+        for offset, new_row in enumerate(new_rows):
+            position = start + offset
+            changed = not self._rows[position].sameContent(new_row)
+            # Always take the new row: the renderer may have deleted the old symbol
+            self._rows[position] = new_row
+            if changed and changed_from is None:
+                changed_from = position
+            elif not changed and changed_from is not None:
+                self._emitRowsChanged(changed_from, position - 1)
+                changed_from = None
+        if changed_from is not None:
+            self._emitRowsChanged(changed_from, start + len(new_rows) - 1)
+
+    def _emitRowsChanged(self, first, last):
+        self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1))
+
+    def clear(self):
+        self.setLegend([])
+
+    def legendRow(self, row):
+        return self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 2
+
+    def data(self, index, role=DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+
+        row = self._rows[index.row()]
+        column = index.column()
+
+        if column == self.SYMBOL_COLUMN:
+            if role == DecorationRole and row.symbol is not None:
+                return self._preview(index.row(), row)
+            if role == CheckStateRole and row.checked is not None and self._check_layer is not None:
+                renderer = self._check_layer.renderer()
+                if renderer is not None:
+                    return Checked if renderer.legendSymbolItemChecked(row.key) else Unchecked
+            return None
+
+        if column == self.LEGEND_COLUMN:
+            if role == DisplayRole:
+                label = translate('LegendView', "Other values") if row.isOther() else row.label
+                if self._feature_counts is not None:
+                    label = '%s [%d]' % (label, self._feature_counts.get(row.key, 0))
+                return label
+            if role == FontRole and row.isOther():
+                return self._other_font
+        return None
+
+    def flags(self, index):
+        flags = super(LegendTableModel, self).flags(index)
+        if (index.isValid() and index.column() == self.SYMBOL_COLUMN
+                and index.row() < len(self._rows) and self._rows[index.row()].checked is not None):
+            flags |= ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role=CheckStateRole):
+        if role != CheckStateRole or not index.isValid() or index.column() != self.SYMBOL_COLUMN:
+            return False
+        # Qt6 hands the state over as a plain int
+        checked = getattr(value, 'value', value) == getattr(Checked, 'value', Checked)
+        self.setChecked([self._rows[index.row()].key], checked)
+        return True
+
+    def headerData(self, section, orientation, role=DisplayRole):
+        if role == DisplayRole and orientation == Horizontal and 0 <= section < len(self._headers):
+            return self._headers[section]
+        return None
+
+    def _preview(self, row_index, row):
+        cache = self._preview_cache
+        key = cache.cacheKey(row.symbolKey(), self._icon_size, self._device_pixel_ratio)
+
+        pixmap = cache.get(key)
+        if pixmap is not None:
+            return pixmap
+
+        renderer = self._preview_renderer
+        if renderer is not None and renderer.isPending(key):
+            self._waiting_rows.setdefault(key, set()).add(row_index)
+            return self.placeholder()
+
+        if renderer is None:
+            pixmap = renderPreview(row.symbol, self._icon_size, self._device_pixel_ratio)
+            cache.insert(key, pixmap)
+            return pixmap
+
+        self._waiting_rows.setdefault(key, set()).add(row_index)
+        renderer.request(key, row.symbol, self._icon_size, self._device_pixel_ratio)
+        return self.placeholder()
+
+    def placeholder(self):
+        """Neutral swatch shown while a preview is being rendered"""
+        if self._placeholder is None:
+            ratio = self._device_pixel_ratio or 1.0
+            self._placeholder = QPixmap(int(self._icon_size.width() * 0.95 * ratio),
+                                        int(self._icon_size.height() * 0.95 * ratio))
+            self._placeholder.fill(QColor(0, 0, 0, 24))
+            self._placeholder.setDevicePixelRatio(ratio)
+        return self._placeholder
+
+    def _previewRendered(self, key, generation, image):
+        # Always, even if updateLegend dropped the rows waiting for it
+        self._preview_renderer.finished(key)
+        rows = self._waiting_rows.pop(key, None)
+        rows = sorted(row_index for row_index in (rows or ()) if row_index < len(self._rows))
+        if image.isNull():
+            # The worker failed; render on the GUI thread as before
+            if not rows:
+                return
+            row = self._rows[rows[0]]
+            pixmap = renderPreview(row.symbol, self._icon_size, self._device_pixel_ratio)
+        else:
+            pixmap = QPixmap.fromImage(image)
+        # Finished renders stay valid for their key even if the layer changed
+        self._preview_cache.insert(key, pixmap)
+        for row_index in rows:
+            index = self.index(row_index, self.SYMBOL_COLUMN)
+            self.dataChanged.emit(index, index)
+
+
+class RasterLegendModel(QAbstractListModel):
+    """List model for raster legends (palette, pseudocolor, singleband gray)
+
+    Items are exposed to the view in batches through canFetchMore/fetchMore,
+    so palettes with thousands of entries are populated as they scroll into
+    view.  Color swatches are kept in the shared preview cache.
+    """
+
+    FETCH_BATCH_SIZE = 256
+
+    def __init__(self, parent=None, preview_cache=None):
+        super(RasterLegendModel, self).__init__(parent)
+        # (label, QColor) pairs from QgsRasterRenderer.legendSymbologyItems()
+        self._items = []
+        self._loaded = 0
+        self._swatch_size = QSize(16, 16)
+        self._device_pixel_ratio = 1.0
+        self._preview_cache = preview_cache if preview_cache is not None else sharedPreviewCache()
+
+    def setSwatchSize(self, size: QSize, device_pixel_ratio=1.0):
+        if size == self._swatch_size and device_pixel_ratio == self._device_pixel_ratio:
+            return
+        self._swatch_size = QSize(size)
+        self._device_pixel_ratio = device_pixel_ratio
+        if self._loaded:
+            self.dataChanged.emit(self.index(0, 0), self.index(self._loaded - 1, 0))
+
+    def setItems(self, items):
+        self.beginResetModel()
+        self._items = list(items)
+        self._loaded = 0
+        self.endResetModel()
+
+    def clear(self):
+        self.setItems([])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded < len(self._items)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.FETCH_BATCH_SIZE, len(self._items) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        label, color = self._items[index.row()]
+        if role == DisplayRole:
+            return label
+        if role == DecorationRole:
+            return self._swatch(color)
+        return None
+
+    def _swatch(self, color):
+        cache = self._preview_cache
+        key = cache.cacheKey(('color', color.rgba()), self._swatch_size, self._device_pixel_ratio)
+        pixmap = cache.get(key)
+        if pixmap is None:
+            ratio = self._device_pixel_ratio or 1.0
+            pixmap = QPixmap(int(self._swatch_size.width() * ratio),
+                             int(self._swatch_size.height() * ratio))
+            pixmap.fill(color)
+            pixmap.setDevicePixelRatio(ratio)
+            cache.insert(key, pixmap)
+        return pixmap
+
+
+class LegendSymbolDelegate(QStyledItemDelegate):
+    """Paints the check box of a checkable class and the symbol preview
+    centered in the rest of its cell"""
+
+    def paint(self, painter, option, index):
+        if index.column() != LegendTableModel.SYMBOL_COLUMN:
+            super(LegendSymbolDelegate, self).paint(painter, option, index)
+            return
+
+        rect = option.rect
+        if index.data(CheckStateRole) is not None:
+            # Same indicator rectangle editorEvent hit-tests against
+            view_option = QStyleOptionViewItem(option)
+            self.initStyleOption(view_option, index)
+            widget = view_option.widget
+            style = widget.style() if widget is not None else QApplication.style()
+            check_rect = style.subElementRect(SE_ItemViewItemCheckIndicator, view_option, widget)
+            view_option.rect = check_rect
+            style.drawPrimitive(PE_IndicatorItemViewItemCheck, view_option, painter, widget)
+            rect = QRect(check_rect.right() + 1, rect.y(), rect.right() - check_rect.right(), rect.height())
+
+        pixmap = index.data(DecorationRole)
+        if pixmap is None or pixmap.isNull():
+            return
+
+        ratio = pixmap.devicePixelRatio() or 1.0
+        width = pixmap.width() / ratio
+        height = pixmap.height() / ratio
+        x = rect.x() + (rect.width() - width) / 2
+        y = rect.y() + (rect.height() - height) / 2
+        painter.drawPixmap(int(x), int(y), pixmap)
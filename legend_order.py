@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LegendOrder
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Display order of the layers registered with legend_ project variables.
+
+ Layers whose variable holds a number come first, by that number; the rest
+ follow by name.  The two sorted lists are kept between rebuilds of the
+ combo box and only the variables whose value or layer changed are moved.
+"""
+
+import re
+from bisect import bisect_left, bisect_right, insort
+from typing import NamedTuple, Union
+
+from .qt_compat import QVariant
+
+_INTEGER = re.compile(r"\d+")
+_DECIMAL = re.compile(r"\d*\.\d+")
+
+
+def parseOrderValue(value):
+    """Return the int or float priority held by a variable value, or None"""
+    # None and null QVariant values have no priority
+    if value is None or isinstance(value, QVariant):
+        return None
+    if not isinstance(value, str):
+        try:
+            value = str(value)
+        except Exception:
+            return None
+    if _INTEGER.fullmatch(value) is not None:
+        return int(value)
+    if _DECIMAL.fullmatch(value) is not None:
+        return float(value)
+    return None
+
+
+class OrderEntry(NamedTuple):
+    """One combo box entry; tuples compare by key, then variable name"""
+
+    key: Union[int, float, str]
+    # Empty for the active layer that has no legend_ variable
+    variable: str
+    layer_id: str
+
+
+class LegendOrder:
+    """Incrementally sorted display order of the legend_ variables"""
+
+    def __init__(self):
+        # variable name -> (layer id, raw value, entry, numeric)
+        self._variables = {}
+        self._numeric = []
+        self._named = []
+        self.moved = 0
+
+    def update(self, variables):
+        """Sync with {variable name: (layer id, layer name, raw value)}
+
+        Unchanged variables keep their place; changed, added and removed ones
+        are moved with a bisect.  Returns the number of entries moved.
+        """
+        moved = 0
+        for name in list(self._variables):
+            if name not in variables:
+                self._remove(name)
+                moved += 1
+
+        for name, (layer_id, layer_name, value) in variables.items():
+            known = self._variables.get(name)
+            if known is not None:
+                if known[0] == layer_id and known[1] == value:
+                    continue
+                self._remove(name)
+
+            priority = parseOrderValue(value)
+            if priority is None:
+                entry = OrderEntry(layer_name, name, layer_id)
+                insort(self._named, entry)
+            else:
+                entry = OrderEntry(priority, name, layer_id)
+                insort(self._numeric, entry)
+            self._variables[name] = (layer_id, value, entry, priority is not None)
+            moved += 1
+
+        self.moved += moved
+        return moved
+
+    def entries(self, extra=None):
+        """Numeric entries then named ones; extra is merged into the named part"""
+        if extra is None:
+            return self._numeric + self._named
+        position = bisect_right(self._named, extra)
+        return self._numeric + self._named[:position] + [extra] + self._named[position:]
+
+    def layerIds(self):
+        return {entry.layer_id for entry in self._numeric + self._named}
+
+    def clear(self):
+        self._variables.clear()
+        self._numeric = []
+        self._named = []
+
+    def __len__(self):
+        return len(self._variables)
+
+    def _remove(self, name):
+        layer_id, value, entry, numeric = self._variables.pop(name)
+        entries = self._numeric if numeric else self._named
+        del entries[bisect_left(entries, entry)]
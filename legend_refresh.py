@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LegendSubscriptionManager
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Bookkeeping for the layer signals that trigger a legend refresh, the
+ scheduler that turns bursts of those signals into a single rebuild, and the
+ throttle for the canvas repaints of the opacity slider.
+"""
+
+import time
+from functools import partial
+
+from qgis.PyQt.QtCore import QObject, QTimer
+
+from .qt_compat import pyqtSignal
+
+
+class LegendSubscriptionManager(QObject):
+    """Connects legendChanged of each listed layer exactly once
+
+    Layers are disconnected when they leave the list or the project.  The
+    manager re-emits legendChanged with the id of the layer that changed.
+    """
+
+    legendChanged = pyqtSignal(str)
+
+    def __init__(self, project, parent=None):
+        super(LegendSubscriptionManager, self).__init__(parent)
+        self._project = project
+        # layer id -> (layer, connected slot)
+        self._subscriptions = {}
+        project.layersWillBeRemoved.connect(self._layersWillBeRemoved)
+
+    def subscribe(self, layer):
+        layer_id = layer.id()
+        if layer_id in self._subscriptions:
+            return
+        slot = partial(self.legendChanged.emit, layer_id)
+        layer.legendChanged.connect(slot)
+        self._subscriptions[layer_id] = (layer, slot)
+
+    def unsubscribe(self, layer_id):
+        subscription = self._subscriptions.pop(layer_id, None)
+        if subscription is None:
+            return
+        layer, slot = subscription
+        try:
+            layer.legendChanged.disconnect(slot)
+        except (TypeError, RuntimeError):
+            # Already disconnected or the layer has been deleted
+            pass
+
+    def sync(self, layers):
+        """Subscribe exactly the given layers"""
+        wanted = {layer.id(): layer for layer in layers}
+        for layer_id in list(self._subscriptions):
+            if layer_id not in wanted:
+                self.unsubscribe(layer_id)
+        for layer in wanted.values():
+            self.subscribe(layer)
+
+    def clear(self):
+        for layer_id in list(self._subscriptions):
+            self.unsubscribe(layer_id)
+
+    def isSubscribed(self, layer_id):
+        return layer_id in self._subscriptions
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def _layersWillBeRemoved(self, layer_ids):
+        for layer_id in layer_ids:
+            self.unsubscribe(layer_id)
+
+
+# Quiet period before a burst of legendChanged signals is turned into a rebuild
+DEFAULT_REFRESH_DELAY_MS = 80
+
+
+class LegendRefreshScheduler(QObject):
+    """Debounces refresh requests into one call of the refresh callback
+
+    The callback runs once the requests have been quiet for delay_ms, or at
+    the latest after max_wait_ms so a continuous stream still repaints.  While
+    is_visible() is False the refresh is dropped and replayed by flushStale().
+    """
+
+    def __init__(self, callback, delay_ms=DEFAULT_REFRESH_DELAY_MS, is_visible=None,
+                 max_wait_ms=None, parent=None):
+        super(LegendRefreshScheduler, self).__init__(parent)
+        self._callback = callback
+        self._is_visible = is_visible
+        self._delay_ms = int(delay_ms)
+        self._max_wait_ms = max_wait_ms
+        self._first_request = None
+        self._stale = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+        self.requests = 0
+        self.refreshes = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def setDelay(self, delay_ms):
+        self._delay_ms = max(0, int(delay_ms))
+
+    def delay(self):
+        return self._delay_ms
+
+    def schedule(self):
+        """Request a refresh; requests inside the quiet period are merged"""
+        self.requests += 1
+        if self._timer.isActive():
+            self.merged += 1
+        else:
+            self._first_request = time.monotonic()
+
+        max_wait = self._max_wait_ms if self._max_wait_ms is not None else self._delay_ms * 10
+        waited_ms = (time.monotonic() - self._first_request) * 1000.0
+        self._timer.start(max(0, min(self._delay_ms, int(max_wait - waited_ms))))
+
+    def isPending(self):
+        return self._timer.isActive()
+
+    def flush(self):
+        """Run a pending refresh now"""
+        if self._timer.isActive():
+            self._timer.stop()
+            self._fire()
+
+    def flushStale(self):
+        """Replay a refresh that was dropped while hidden"""
+        if self._stale:
+            self._stale = False
+            self._timer.stop()
+            self._fire()
+
+    def cancel(self):
+        self._timer.stop()
+        self._stale = False
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'refreshes': self.refreshes,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'delay_ms': self._delay_ms,
+        }
+
+    def _fire(self):
+        self._first_request = None
+        if self._is_visible is not None and not self._is_visible():
+            self._stale = True
+            self.dropped += 1
+            return
+        self.refreshes += 1
+        self._callback()
+
+
+# Minimum time between two canvas repaints while the opacity is changing
+DEFAULT_REPAINT_INTERVAL_MS = 150
+
+
+class RepaintThrottle(QObject):
+    """Rate-limits the layer repaints requested by the opacity widget
+
+    The first request repaints at once; requests inside interval_ms are
+    merged into one trailing repaint of the latest state.  Each repaint stops
+    the canvas render in progress first.  finish() runs a pending repaint
+    immediately, so releasing the slider paints the final value without
+    waiting.
+    """
+
+    def __init__(self, canvas, interval_ms=DEFAULT_REPAINT_INTERVAL_MS, parent=None):
+        super(RepaintThrottle, self).__init__(parent)
+        self._canvas = canvas
+        self._interval_ms = max(0, int(interval_ms))
+        self._layer = None
+        self._last_repaint = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._repaint)
+
+        self.requests = 0
+        self.repaints = 0
+        self.avoided = 0
+
+    def request(self, layer):
+        self.requests += 1
+        if self._timer.isActive():
+            # Merged into the repaint that is already scheduled
+            self.avoided += 1
+            self._layer = layer
+            return
+
+        self._layer = layer
+        elapsed_ms = None
+        if self._last_repaint is not None:
+            elapsed_ms = (time.monotonic() - self._last_repaint) * 1000.0
+        if elapsed_ms is None or elapsed_ms >= self._interval_ms:
+            self._repaint()
+        else:
+            self._timer.start(int(self._interval_ms - elapsed_ms))
+
+    def finish(self):
+        """Repaint now if a repaint is pending"""
+        if self._timer.isActive():
+            self._timer.stop()
+            self._repaint()
+
+    def cancel(self):
+        self._timer.stop()
+        self._layer = None
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'repaints': self.repaints,
+            'avoided': self.avoided,
+            'interval_ms': self._interval_ms,
+        }
+
+    def _repaint(self):
+        layer, self._layer = self._layer, None
+        if layer is None:
+            return
+        self._last_repaint = time.monotonic()
+        try:
+            if self._canvas is not None and self._canvas.isDrawing():
+                self._canvas.stopRendering()
+            layer.triggerRepaint()
+        except RuntimeError:
+            # The layer was deleted while the repaint was pending
+            return
+        self.repaints += 1
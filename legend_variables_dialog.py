@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ LegendVariablesDialog
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Dialog listing the legend_ project variables.  Edits and deletions are
+ buffered in the model and written with one setProjectVariables call.
+"""
+
+from qgis.PyQt.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+from qgis.PyQt.QtWidgets import (QAbstractItemView, QDialog, QHBoxLayout, QInputDialog,
+                                 QLabel, QLineEdit, QMessageBox, QPushButton, QTableView,
+                                 QVBoxLayout)
+from qgis.core import QgsExpressionContextUtils
+
+from .qt_compat import (QFont, pyqtSignal, translate, DisplayRole, EditRole, FontRole,
+                        ToolTipRole, Horizontal, ItemIsEnabled, ItemIsSelectable,
+                        ItemIsEditable, CaseInsensitive, ExtendedSelection)
+
+VARIABLE_PREFIX = 'legend_'
+
+
+class LegendVariablesModel(QAbstractTableModel):
+    """legend_ variables with a buffer of pending edits and deletions
+
+    The project is only written by commit(); until then the model shows the
+    pending values in italics and pending deletions struck out.
+    """
+
+    NAME_COLUMN = 0
+    VALUE_COLUMN = 1
+
+    # Number of pending changes
+    pendingChanged = pyqtSignal(int)
+
+    def __init__(self, variables, parent=None):
+        super(LegendVariablesModel, self).__init__(parent)
+        self._headers = [translate('LegendView', 'Variable'), translate('LegendView', 'Value')]
+        self._load(variables)
+
+    def _load(self, variables):
+        self._names = sorted(name for name in variables if name.startswith(VARIABLE_PREFIX))
+        self._values = {name: variables[name] for name in self._names}
+        # name -> new value, or None for a deletion
+        self._pending = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._names)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 2
+
+    def headerData(self, section, orientation, role=DisplayRole):
+        if role == DisplayRole and orientation == Horizontal and 0 <= section < len(self._headers):
+            return self._headers[section]
+        return None
+
+    def flags(self, index):
+        flags = ItemIsEnabled | ItemIsSelectable
+        if index.column() == self.VALUE_COLUMN:
+            flags |= ItemIsEditable
+        return flags
+
+    def variableName(self, row):
+        return self._names[row]
+
+    def value(self, row):
+        """Value shown for row, pending edits included"""
+        name = self._names[row]
+        value = self._pending.get(name, self._values[name])
+        return '' if value is None else str(value)
+
+    def data(self, index, role=DisplayRole):
+        if not index.isValid():
+            return None
+        name = self._names[index.row()]
+
+        if role in (DisplayRole, EditRole):
+            if index.column() == self.NAME_COLUMN:
+                return name
+            return self.value(index.row())
+
+        if role == FontRole and name in self._pending:
+            font = QFont()
+            if self._pending[name] is None:
+                font.setStrikeOut(True)
+            else:
+                font.setItalic(True)
+            return font
+
+        if role == ToolTipRole and name in self._pending:
+            if self._pending[name] is None:
+                return translate('LegendView', 'Deleted when applied')
+            return translate('LegendView', 'Changed, was: %s') % self._values[name]
+        return None
+
+    def setData(self, index, value, role=EditRole):
+        if role != EditRole or not index.isValid() or index.column() != self.VALUE_COLUMN:
+            return False
+        self.setValues([index.row()], '' if value is None else str(value))
+        return True
+
+    def setValues(self, rows, value):
+        """Buffer value for every row in rows"""
+        for row in rows:
+            name = self._names[row]
+            if value == self._values[name]:
+                self._pending.pop(name, None)
+            else:
+                self._pending[name] = value
+        self._rowsChanged(rows)
+
+    def markDeleted(self, rows):
+        for row in rows:
+            self._pending[self._names[row]] = None
+        self._rowsChanged(rows)
+
+    def revert(self):
+        rows = [self._names.index(name) for name in self._pending]
+        self._pending.clear()
+        self._rowsChanged(rows)
+
+    def pendingCount(self):
+        return len(self._pending)
+
+    def commit(self, project):
+        """Write the pending changes with one setProjectVariables call
+
+        Returns the number of variables changed.
+        """
+        if not self._pending:
+            return 0
+        # setProjectVariables replaces the whole set, so start from all of them
+        variables = project.customVariables()
+        for name, value in self._pending.items():
+            if value is None:
+                variables.pop(name, None)
+            else:
+                variables[name] = value
+        QgsExpressionContextUtils.setProjectVariables(project, variables)
+
+        count = len(self._pending)
+        self.beginResetModel()
+        self._load(variables)
+        self.endResetModel()
+        self.pendingChanged.emit(0)
+        return count
+
+    def _rowsChanged(self, rows):
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), 1))
+        self.pendingChanged.emit(len(self._pending))
+
+
+class LegendVariablesDialog(QDialog):
+    """Filterable, sortable list of the legend_ variables with batched edits"""
+
+    def __init__(self, project, parent=None):
+        super(LegendVariablesDialog, self).__init__(parent)
+        self.project = project
+        # Number of variables written by Apply while the dialog was open
+        self.committed = 0
+        self.setWindowTitle(translate('LegendView', 'Legend variables'))
+
+        self.model = LegendVariablesModel(project.customVariables(), self)
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterKeyColumn(LegendVariablesModel.NAME_COLUMN)
+        self.proxy.setFilterCaseSensitivity(CaseInsensitive)
+
+        layout = QVBoxLayout(self)
+        self.filterEdit = QLineEdit(self)
+        self.filterEdit.setPlaceholderText(translate('LegendView', 'Filter variables'))
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterEdit.textChanged.connect(self.proxy.setFilterFixedString)
+        layout.addWidget(self.filterEdit)
+
+        self.tableView = QTableView(self)
+        self.tableView.setModel(self.proxy)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.setSelectionMode(ExtendedSelection)
+        select_rows = getattr(QAbstractItemView, 'SelectRows', None)
+        if select_rows is None:
+            select_rows = QAbstractItemView.SelectionBehavior.SelectRows
+        self.tableView.setSelectionBehavior(select_rows)
+        self.tableView.horizontalHeader().setStretchLastSection(True)
+        self.tableView.verticalHeader().setVisible(False)
+        layout.addWidget(self.tableView)
+
+        buttons = QHBoxLayout()
+        set_button = QPushButton(translate('LegendView', 'Set value...'), self)
+        delete_button = QPushButton(translate('LegendView', 'Delete'), self)
+        revert_button = QPushButton(translate('LegendView', 'Revert'), self)
+        self.applyButton = QPushButton(translate('LegendView', 'Apply'), self)
+        close_button = QPushButton(translate('LegendView', 'Close'), self)
+        set_button.clicked.connect(self.setSelectedValues)
+        delete_button.clicked.connect(self.deleteSelected)
+        revert_button.clicked.connect(self.model.revert)
+        self.applyButton.clicked.connect(self.apply)
+        close_button.clicked.connect(self.reject)
+        self.pendingLabel = QLabel(self)
+        for widget in (set_button, delete_button, revert_button, self.pendingLabel):
+            buttons.addWidget(widget)
+        buttons.addStretch()
+        buttons.addWidget(self.applyButton)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+
+        self.model.pendingChanged.connect(self._pendingChanged)
+        self._pendingChanged(0)
+        self.resize(520, 420)
+
+    def selectedRows(self):
+        """Source model rows of the selection"""
+        rows = set()
+        for index in self.tableView.selectionModel().selectedRows():
+            rows.add(self.proxy.mapToSource(index).row())
+        return sorted(rows)
+
+    def setSelectedValues(self):
+        rows = self.selectedRows()
+        if not rows:
+            return
+        text, ok = QInputDialog.getText(
+            self, translate('LegendView', 'Edit variable'),
+            translate('LegendView', 'Value for %d variables') % len(rows),
+            text=self.model.value(rows[0]))
+        if ok:
+            self.model.setValues(rows, text)
+
+    def deleteSelected(self):
+        self.model.markDeleted(self.selectedRows())
+
+    def apply(self):
+        try:
+            self.committed += self.model.commit(self.project)
+        except Exception:
+            QMessageBox.warning(self, translate('LegendView', 'Error'),
+                                translate('LegendView', 'Could not update variables'))
+
+    def reject(self):
+        # Close button, Escape and the window close all end up here
+        if self.model.pendingCount():
+            answer = QMessageBox.question(
+                self, translate('LegendView', 'Pending changes'),
+                translate('LegendView', 'Apply %d pending changes?') % self.model.pendingCount(),
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+            if answer == QMessageBox.Cancel:
+                return
+            if answer == QMessageBox.Yes:
+                self.apply()
+        super(LegendVariablesDialog, self).reject()
+
+    def _pendingChanged(self, count):
+        self.pendingLabel.setText(translate('LegendView', '%d pending') % count if count else '')
+        self.applyButton.setEnabled(count > 0)
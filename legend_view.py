@@ -21,38 +21,54 @@
  *                                                                         *
  ***************************************************************************/
 """
+import os.path
 import re
+import time
 
-# Import Qt compatibility module first
-from .qt_compat import QSettings, QTranslator, QCoreApplication, Qt, QIcon, QAction, QDockWidget, WA_DeleteOnClose, RightDockWidgetArea, translate, is_qt5, is_qt6, QT_VERSION, QtWidgets, QSize
+_IMPORT_STARTED = time.perf_counter()
 
-from qgis.core import QgsSettings, QgsMessageLog, QgsProject, QgsExpressionContextUtils
+# Only what is needed to register the action is imported here.  The Qt
+# compatibility module, resources and the dock widget (whose module compiles
+# the .ui file) are loaded on the first run(), see _loadDockWidgetClass().
+from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, QTimer, QT_VERSION_STR
+from qgis.PyQt.QtGui import QIcon
+from qgis.PyQt.QtWidgets import QAction
 
-# Initialize Qt resources from file resources.py
-if is_qt5():
-    # Qt5 specific resource file with forced registration
-    try:
-        from . import resources_rc_qt5
-        # Force resource registration for Qt5 multiple times if needed
-        resources_rc_qt5.qInitResources()
-        # Double-check registration
-        if hasattr(resources_rc_qt5, 'qInitResources'):
-            resources_rc_qt5.qInitResources()
-    except ImportError:
-        try:
-            from .resources_rc import *
-        except:
-            pass
-else:
-    # Qt6 and fallback
-    from .resources_rc import *
+from qgis.core import QgsSettings, QgsMessageLog, QgsProject, QgsExpressionContextUtils, Qgis
 
-# Import version information
-from .version import __version__, get_version_info, get_compatibility_info
+# Load times in milliseconds, for comparing plugin start-up cost
+LOAD_TIMINGS = {}
 
-# Import the code for the DockWidget
-from .legend_view_dockwidget import LegendViewDockWidget
-import os.path
+
+def _loadResources():
+    """Register the compiled Qt resources (icons)"""
+    from .qt_compat import is_qt5
+    if is_qt5():
+        # Qt5 specific resource file with forced registration
+        try:
+            from . import resources_rc_qt5
+            # Force resource registration for Qt5 multiple times if needed
+            resources_rc_qt5.qInitResources()
+            # Double-check registration
+            if hasattr(resources_rc_qt5, 'qInitResources'):
+                resources_rc_qt5.qInitResources()
+        except ImportError:
+            try:
+                from . import resources_rc
+            except:
+                pass
+    else:
+        # Qt6 and fallback
+        from . import resources_rc
+
+
+def _loadDockWidgetClass():
+    """Import the dock widget module on first use and return its class"""
+    started = time.perf_counter()
+    _loadResources()
+    from .legend_view_dockwidget import LegendViewDockWidget
+    LOAD_TIMINGS.setdefault('first_run_import_ms', (time.perf_counter() - started) * 1000.0)
+    return LegendViewDockWidget
 
 class LegendView:
     """QGIS Plugin Implementation."""
@@ -185,7 +201,7 @@ class LegendView:
             icon = self.create_fallback_icon()
         
         # Qt6ではparent=NoneでQAction生成（ツールバー表示対策）
-        if is_qt6():
+        if QT_VERSION_STR.startswith('6'):
             action = QAction(icon, text)
         else:
             action = QAction(icon, text, parent)
@@ -223,6 +239,15 @@ class LegendView:
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        # Debug panel for the opt-in hot-path profiler
+        if QgsSettings().value("LegendView/profiling", False, type=bool):
+            self.add_action(
+                icon_path,
+                text=self.tr(u'Legend View profiling'),
+                callback=self.showProfiler,
+                add_to_toolbar=False,
+                parent=self.iface.mainWindow())
+
     #--------------------------------------------------------------------------
 
     def onClosePlugin(self):
@@ -260,7 +285,14 @@ class LegendView:
 
     def run(self):
         """Run method that loads and starts the plugin"""
+        self.openDock(deferred=False)
+
+    def openDock(self, deferred=False):
+        """Create (if needed) and show the dock
 
+        With deferred=True the dock shell is shown right away and the legend_
+        variables are resolved and rendered from the event loop afterwards.
+        """
         if not self.pluginIsActive:
             self.pluginIsActive = True
 
@@ -271,8 +303,13 @@ class LegendView:
             #    removed on close (see self.onClosePlugin method)
             if self.dockwidget == None:
                 # Create the dockwidget (after translation) and keep reference
-                self.dockwidget = LegendViewDockWidget(self.iface)
+                LegendViewDockWidget = _loadDockWidgetClass()
+                from .qt_compat import WA_DeleteOnClose
+                started = time.perf_counter()
+                self.dockwidget = LegendViewDockWidget(self.iface, deferred=deferred)
                 self.dockwidget.setAttribute(WA_DeleteOnClose)
+                LOAD_TIMINGS.setdefault('first_dock_create_ms', (time.perf_counter() - started) * 1000.0)
+                self.logLoadTimings()
 
             # connect to provide cleanup on closing of dockwidget
             self.dockwidget.closingPlugin.connect(self.onClosePlugin)
@@ -280,10 +317,21 @@ class LegendView:
             self.restoreState()
 
         if self.dockwidget:
+            if deferred and not self.dockwidget.populated:
+                # Let QGIS finish loading the project before any legend work
+                QTimer.singleShot(0, self.populateDeferredDock)
+            elif not self.dockwidget.populated:
+                self.dockwidget.populate()
+
             if self.dockwidget.isFloating():
                 self.dockwidget.activateWindow()
             else:
                 self.dockwidget.raise_()
+
+    def populateDeferredDock(self):
+        # The dock may have been closed before the event loop got here
+        if self.dockwidget is not None:
+            self.dockwidget.populate()
                 
     def onProjectClose(self):
         if self.dockwidget:
@@ -299,6 +347,7 @@ class LegendView:
         s.setValue("LegendView/geometry", self.dockwidget.saveGeometry())
 
     def restoreState(self):
+        from .qt_compat import RightDockWidgetArea
         s = QgsSettings()
         is_floating = s.value("LegendView/isfloating", "0") == "1"
 
@@ -328,11 +377,25 @@ class LegendView:
         if ecs.hasVariable(name):
             value = ecs.variable(name)
             if value == "1":
-                self.run()
+                # Keep the project-load critical path free of legend work
+                self.openDock(deferred=True)
+
+    def showProfiler(self):
+        from .profiling import ProfilerPanel
+        panel = ProfilerPanel(parent=self.iface.mainWindow())
+        panel.exec_()
+
+    def logLoadTimings(self):
+        """Write plugin load times to the message log when enabled"""
+        if QgsSettings().value("LegendView/logLoadTimings", False, type=bool):
+            QgsMessageLog.logMessage(
+                ', '.join('%s=%.1f' % item for item in sorted(LOAD_TIMINGS.items())),
+                'LegendView', Qgis.Info)
 
     def create_fallback_icon(self):
         """Create a simple fallback icon when other methods fail"""
         try:
+            from .qt_compat import is_qt5
             # Import Qt modules based on version
             if is_qt5():
                 from PyQt5.QtGui import QPixmap, QPainter, QColor, QPen
@@ -367,4 +430,4 @@ class LegendView:
             return QIcon()
 
 
-
+LOAD_TIMINGS['module_import_ms'] = (time.perf_counter() - _IMPORT_STARTED) * 1000.0
@@ -27,14 +27,14 @@ from qgis.core import QgsWkbTypes
 #QMessageBox.information(self,'Message',type(layer).__name__,QMessageBox.Ok)
 
 import os
-import re
+import hashlib
 from io import BytesIO
 
 # Import Qt compatibility module
 from .qt_compat import *
 
 # Use QGIS-provided PyQt bindings to remain version independent
-from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QPushButton, QInputDialog, QMessageBox, QHBoxLayout
+from qgis.PyQt.QtWidgets import QMenu, QToolButton, QSlider
 
 from qgis.core import *
 from qgis.gui import *
@@ -42,18 +42,56 @@ from qgis.gui import *
 # Import resources explicitly
 from . import resources_rc
 
-from operator import itemgetter
+from .legend_model import extractLegendRows, LegendTableModel, LegendSymbolDelegate, RasterLegendModel
+from .preview_renderer import PreviewRenderer
+from .layer_path_index import LayerPathIndex, LayerPathMap
+from .legend_refresh import (LegendSubscriptionManager, LegendRefreshScheduler, RepaintThrottle,
+                             DEFAULT_REFRESH_DELAY_MS, DEFAULT_REPAINT_INTERVAL_MS)
+from .legend_order import LegendOrder, OrderEntry
+from .layer_combo_model import LayerComboModel
+from .legend_variables_dialog import LegendVariablesDialog
+from .profiling import profiled, sharedProfiler
+from .visible_classes import VisibleClassesFilter
+from .feature_counts import FeatureCountCache
+from .class_index import ClassFeatureIndex
 
-FORM_CLASS, _ = uic.loadUiType(os.path.join(
-    os.path.dirname(__file__), 'legend_view_dockwidget_base.ui'))
+
+UI_FILE = os.path.join(os.path.dirname(__file__), 'legend_view_dockwidget_base.ui')
+
+# Widgets the dock code relies on; checked after setupUi
+REQUIRED_WIDGETS = ('comboBox', 'currentLayerButton', 'registerButton', 'prioritySpinBox',
+                    'varsButton', 'mOpacityWidget', 'styleLabel', 'styleComboBox',
+                    'tableView', 'listView')
+
+
+def _loadFormClass():
+    """Use the form module compiled by create_zip.py, else compile the .ui now"""
+    try:
+        from . import legend_view_dockwidget_ui as form_module
+        with open(UI_FILE, 'rb') as f:
+            ui_sha1 = hashlib.sha1(f.read()).hexdigest()
+        # A form compiled from an older .ui would miss widgets
+        if form_module.UI_SOURCE_SHA1 == ui_sha1:
+            return form_module.Ui_LegendViewDockWidgetBase
+    except (ImportError, AttributeError, OSError):
+        pass
+    form_class, _ = uic.loadUiType(UI_FILE)
+    return form_class
+
+
+FORM_CLASS = _loadFormClass()
 
 
 class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
     closingPlugin = pyqtSignal()
 
-    def __init__(self, iface, parent=None):
-        """Constructor."""
+    def __init__(self, iface, parent=None, deferred=False):
+        """Constructor.
+
+        With deferred=True only the widgets are built; the legend_ variables
+        are resolved and the first legend is shown by a later populate().
+        """
         super(LegendViewDockWidget, self).__init__(parent)
         # Set up the user interface from Designer.
         # After setupUI you can access any designer object by doing
@@ -61,6 +99,10 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         # http://doc.qt.io/qt-5/designer-using-a-ui-file.html
         # #widgets-and-dialogs-with-auto-connect
         self.setupUi(self)
+        missing = [name for name in REQUIRED_WIDGETS if not hasattr(self, name)]
+        if missing:
+            QgsMessageLog.logMessage('Legend View UI is missing widgets: %s' % ', '.join(missing),
+                                     'LegendView', Qgis.Warning)
         
         # Set window icon for dock widget - try multiple approaches
         try:
@@ -82,7 +124,30 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         
         self.iface = iface
         self.currentLayer = None
+        self.populated = False
+        # Id of the layer whose legend rows are in legendModel
+        self.legendLayerId = None
         self.root = QgsProject.instance().layerTreeRoot()
+        # Layer id -> tree path, patched in place by layer tree signals
+        self.layerPaths = LayerPathMap(self.root, self)
+        # One-pass index of layer tree paths, invalidated by layer tree signals
+        self.layerIndex = LayerPathIndex(self.root, self, paths=self.layerPaths)
+        # Display order of the legend_ variables, kept between combo rebuilds
+        self.legendOrder = LegendOrder()
+        self.legendSubscriptions = LegendSubscriptionManager(QgsProject.instance(), self)
+        self.legendSubscriptions.legendChanged.connect(self.legendChanged)
+        refresh_delay = QgsSettings().value("LegendView/refreshDelay", DEFAULT_REFRESH_DELAY_MS, type=int)
+        self.refreshScheduler = LegendRefreshScheduler(self.showLegend, refresh_delay, self.isVisible, parent=self)
+        # Opacity changes repaint the canvas at a bounded rate
+        repaint_interval = QgsSettings().value("LegendView/opacityRepaintInterval", DEFAULT_REPAINT_INTERVAL_MS, type=int)
+        self.repaintThrottle = RepaintThrottle(self.iface.mapCanvas(), repaint_interval, self)
+        # Opt-in hot-path timings, re-read each time the dock is opened
+        sharedProfiler().setEnabled(QgsSettings().value("LegendView/profiling", False, type=bool))
+        # Merged refreshes and skipped repaints, shown with the timings
+        sharedProfiler().setCounters('legend refresh', self.refreshScheduler.stats)
+        sharedProfiler().setCounters('opacity repaint', self.repaintThrottle.stats)
+        # Select the active layer in the combo box whenever it changes
+        self.followCurrentLayer = QgsSettings().value("LegendView/followCurrentLayer", True, type=bool)
 
         # Qt5/Qt6 compatible orientation usage
         if is_qt5():
@@ -92,16 +157,50 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             vheader = QHeaderView(QtOrientation.Vertical)
             hheader = QHeaderView(QtOrientation.Horizontal)
             
-        self.tableWidget.setVerticalHeader(vheader)
-        self.tableWidget.setHorizontalHeader(hheader)
-        self.tableWidget.setHorizontalHeaderLabels([self.tr("Symbol"), self.tr("Legend")])
-        self.tableWidget.setSelectionMode(NoSelection)
+        self.tableView.setVerticalHeader(vheader)
+        self.tableView.setHorizontalHeader(hheader)
+
+        # Model/view legend table: only visible rows are painted
+        self.previewRenderer = PreviewRenderer(self)
+        self.legendModel = LegendTableModel(self, preview_renderer=self.previewRenderer)
+        self.legendModel.setHeaderLabels([self.tr("Symbol"), self.tr("Legend")])
+        self.legendDelegate = LegendSymbolDelegate(self.tableView)
+        self.tableView.setModel(self.legendModel)
+        self.tableView.setItemDelegate(self.legendDelegate)
+        self.tableView.setSelectionMode(NoSelection)
+        # Class visibility toggled in the table is applied to the layer once per batch
+        self.legendModel.checkStatesChanged.connect(self.legendChecksChanged)
+
+        # Right-click menu of the legend table
+        self.tableView.setContextMenuPolicy(CustomContextMenu)
+        self.tableView.customContextMenuRequested.connect(self.showLegendMenu)
+        # Created when "Visible classes only" is first switched on
+        self.visibleClasses = None
+        # Created when "Show feature count" is first switched on
+        self.featureCounts = None
+        self.showFeatureCount = False
+        # Class -> feature id index behind "Select features" and "Zoom to features"
+        self.classIndex = ClassFeatureIndex(QgsProject.instance(), self)
+        self.classIndex.indexReady.connect(self.classIndexReady)
+        # (layer id, legend key, action) waiting for the index of the layer
+        self.pendingClassAction = None
+        self.tableView.doubleClicked.connect(self.legendRowDoubleClicked)
+
+        self.rasterLegendModel = RasterLegendModel(self)
+        self.listView.setModel(self.rasterLegendModel)
         self.styleComboBox.setVisible(False)
         self.styleLabel.setVisible(False)
 
-        self.comboDataSet()
+        # Combo rows are updated in place by comboDataSet
+        self.layerComboModel = LayerComboModel(self)
+        self.comboBox.setModel(self.layerComboModel)
         self.comboBox.currentIndexChanged.connect(self.currentIndexChanged)
         self.mOpacityWidget.opacityChanged.connect(self.opacityChanged)
+        # Paint the final value as soon as the slider is released
+        opacity_slider = self.mOpacityWidget.findChild(QSlider)
+        if opacity_slider is not None:
+            opacity_slider.sliderReleased.connect(self.repaintThrottle.finish)
+        self.iface.currentLayerChanged.connect(self.activeLayerChanged)
         
         # Connect current layer button
         self.currentLayerButton.clicked.connect(self.selectCurrentLayer)
@@ -115,6 +214,11 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             self.varsButton.clicked.connect(self.showLegendVariables)
         except Exception:
             pass
+        try:
+            self.initRegisterMenu()
+        except AttributeError:
+            # Older .ui without the menu button
+            pass
         
         # Qt5/Qt6 compatible signal connection
         try:
@@ -128,6 +232,23 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                 # Fallback: use index changed and get text manually
                 self.styleComboBox.currentIndexChanged.connect(self._styleComboBoxIndexChanged)
                 
+        if QgsSettings().value("LegendView/visibleClassesOnly", False, type=bool):
+            self.setVisibleClassesOnly(True)
+        if QgsSettings().value("LegendView/showFeatureCount", False, type=bool):
+            self.setShowFeatureCount(True)
+
+        if not deferred:
+            self.populate()
+
+    def populate(self):
+        """Resolve the legend_ variables and show the first legend (once)"""
+        if self.populated:
+            return
+        self.populated = True
+
+        self.comboBox.blockSignals(True)
+        self.comboDataSet()
+        self.comboBox.blockSignals(False)
         self.comboBox.setCurrentIndex(-1)
         self.comboBox.setCurrentIndex(0)
         self.showLegend()
@@ -136,10 +257,41 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         """QGIS/Qt標準の翻訳APIに統一"""
         return QCoreApplication.translate('LegendView', message)
 
+    def showEvent(self, event):
+        super(LegendViewDockWidget, self).showEvent(event)
+        # Rebuild once if the legend changed while the dock was hidden
+        self.refreshScheduler.flushStale()
+
     def closeEvent(self, event):        
+        self.refreshScheduler.cancel()
+        self.legendModel.cancelPreviews()
+        # Let running renders finish before the renderer can be deleted
+        self.previewRenderer.waitForDone()
+        self.legendSubscriptions.clear()
+        if self.visibleClasses is not None:
+            self.visibleClasses.setEnabled(False)
+            self.visibleClasses.setLayer(None)
+        if self.featureCounts is not None:
+            self.featureCounts.clear()
+        self.classIndex.clear()
+        self.pendingClassAction = None
+        self.repaintThrottle.finish()
+        if sharedProfiler().enabled:
+            sharedProfiler().logSummary()
+            QgsMessageLog.logMessage(
+                'Legend refreshes: %(refreshes)d done, %(merged)d merged, %(dropped)d dropped of %(requests)d requests' %
+                self.refreshScheduler.stats(), 'LegendView', Qgis.Info)
+            QgsMessageLog.logMessage(
+                'Opacity repaints: %(repaints)d done, %(avoided)d avoided of %(requests)d requests' %
+                self.repaintThrottle.stats(), 'LegendView', Qgis.Info)
+        try:
+            self.iface.currentLayerChanged.disconnect(self.activeLayerChanged)
+        except (TypeError, RuntimeError):
+            pass
         self.closingPlugin.emit()
         event.accept()
 
+    @profiled('showLegend')
     def showLegend(self):
         layer = self.currentLayer
         if layer is None:
@@ -149,59 +301,189 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         self.initNamedStyleList(layer)
 
         if isinstance(layer,QgsVectorLayer):
-            symbols = layer.renderer().symbols(QgsRenderContext())
-            legendItems = layer.renderer().legendSymbolItems()
             self.mOpacityWidget.setOpacity( layer.opacity())
-            self.tableWidget.setVisible(True)
-            self.tableWidget.horizontalHeader().setDefaultSectionSize(65)
+            self.tableView.setVisible(True)
+            # Checkable classes get their check box in front of the preview
+            renderer = layer.renderer()
+            indicator_width = 0
+            if renderer is not None and renderer.legendSymbolItemsCheckable():
+                indicator_width = self.tableView.style().pixelMetric(PM_IndicatorWidth) + 4
+            self.tableView.horizontalHeader().setDefaultSectionSize(65 + indicator_width)
             
             # Qt6 requires larger row height for better symbol display
             if is_qt6():
-                self.tableWidget.verticalHeader().setDefaultSectionSize(30)  # Same as Qt5
+                self.tableView.verticalHeader().setDefaultSectionSize(30)  # Same as Qt5
             else:
-                self.tableWidget.verticalHeader().setDefaultSectionSize(30)  # Standard for Qt5
+                self.tableView.verticalHeader().setDefaultSectionSize(30)  # Standard for Qt5
                 
-            self.tableWidget.setRowCount(len(symbols))
-            self.tableWidget.setColumnCount(2)
-            self.tableWidget.horizontalHeader().setStretchLastSection(True)
+            self.tableView.horizontalHeader().setStretchLastSection(True)
 
-            pm_icon_size = self.tableWidget.style().pixelMetric(PM_ListViewIconSize)
+            pm_icon_size = self.tableView.style().pixelMetric(PM_ListViewIconSize)
             
             # Use same size for both Qt5 and Qt6
-            icon_size = QSize(self.tableWidget.columnWidth(0) - 10, pm_icon_size)
-
-            i = 0
-            for symbol in symbols:
-                item1 = QTableWidgetItem()
-                label = QLabel()
-                # Use Qt version-specific alignment function
-                setLabelAlignment(label)
-                # Use Qt version-specific symbol preview function for better SVG support
-                pixmap = createSymbolPreview(symbol, icon_size)
-                label.setPixmap(pixmap)
-                self.tableWidget.setCellWidget(i,0,label)
-                i+=1
-
-            j = 0
-            for legendItem in legendItems :
-                label = legendItem.label()
-                other_item = not bool(label)
-                item2 = QTableWidgetItem(self.tr("Other values") if other_item else legendItem.label())
-                if other_item:
-                    font = QFont()
-                    font.setItalic(True)
-                    item2.setFont(font)
-
-                self.tableWidget.setItem(j,1,item2)
-                j+=1
+            icon_size = QSize(self.tableView.columnWidth(0) - 10 - indicator_width, pm_icon_size)
+            self.legendModel.setIconSize(icon_size, self.devicePixelRatioF())
+
+            # Previews are rendered by the model when a row scrolls into view
+            rows = extractLegendRows(layer.renderer())
+            if self.visibleClasses is not None and self.visibleClasses.isEnabled():
+                self.visibleClasses.setLayer(layer)
+                visible_keys = self.visibleClasses.visibleKeys(layer)
+                # All rows are shown until the extent has been scanned
+                if visible_keys is not None:
+                    rows = [row for row in rows if row.key in visible_keys]
+            # Counts arrive later through countsChanged; until then labels are plain
+            counts = self.featureCounts.counts(layer) if self.showFeatureCount else None
+            self.legendModel.setFeatureCounts(counts)
+
+            self.legendModel.setCheckLayer(layer)
+            if self.legendLayerId == layer.id():
+                # Same layer: only the changed rows are touched
+                self.legendModel.updateLegend(rows)
+            else:
+                self.legendModel.setLegend(rows)
+            self.legendLayerId = layer.id()
             
-            self.listWidget.setVisible(False)
+            self.rasterLegendModel.clear()
+            self.listView.setVisible(False)
 
         if isinstance(layer,QgsRasterLayer):
-            self.tableWidget.setVisible(False)
-            self.listWidget.setVisible(True)
+            self.legendLayerId = None
+            self.legendModel.setCheckLayer(None)
+            if self.visibleClasses is not None:
+                # Stop scanning the last vector layer while a raster is shown
+                self.visibleClasses.setLayer(None)
+            self.legendModel.clear()
+            self.tableView.setVisible(False)
+            self.listView.setVisible(True)
             self.mOpacityWidget.setOpacity( layer.renderer().opacity())
+
+            # Entries are handed to the view in batches as they scroll into view
+            pm_icon_size = self.listView.style().pixelMetric(PM_ListViewIconSize)
+            swatch_size = QSize(pm_icon_size, pm_icon_size)
+            self.listView.setIconSize(swatch_size)
+            self.rasterLegendModel.setSwatchSize(swatch_size, self.devicePixelRatioF())
+            self.rasterLegendModel.setItems(layer.renderer().legendSymbologyItems())
         
+    def showLegendMenu(self, position):
+        """Context menu of the legend table"""
+        menu = QMenu(self.tableView)
+        index = self.tableView.indexAt(position)
+        if index.isValid() and isinstance(self.currentLayer, QgsVectorLayer):
+            key = self.legendModel.legendRow(index.row()).key
+            select_action = menu.addAction(self.tr('Select features'))
+            select_action.triggered.connect(lambda checked=False: self.selectClassFeatures(key))
+            zoom_action = menu.addAction(self.tr('Zoom to features'))
+            zoom_action.triggered.connect(lambda checked=False: self.zoomToClass(key))
+            menu.addSeparator()
+        renderer = self.currentLayer.renderer() if isinstance(self.currentLayer, QgsVectorLayer) else None
+        if renderer is not None and renderer.legendSymbolItemsCheckable() and self.legendModel.rowCount():
+            # Every class of the renderer, including those hidden by "Visible classes only"
+            keys = [row.key for row in extractLegendRows(renderer)]
+            menu.addAction(self.tr('Check all')).triggered.connect(
+                lambda checked=False: self.legendModel.setChecked(keys, True))
+            menu.addAction(self.tr('Check none')).triggered.connect(
+                lambda checked=False: self.legendModel.setChecked(keys, False))
+            menu.addAction(self.tr('Invert check')).triggered.connect(
+                lambda checked=False: self.legendModel.invertChecked(keys))
+            menu.addSeparator()
+        visible_only = menu.addAction(self.tr('Visible classes only'))
+        visible_only.setCheckable(True)
+        visible_only.setChecked(self.visibleClasses is not None and self.visibleClasses.isEnabled())
+        visible_only.toggled.connect(self.setVisibleClassesOnly)
+        feature_count = menu.addAction(self.tr('Show feature count'))
+        feature_count.setCheckable(True)
+        feature_count.setChecked(self.showFeatureCount)
+        feature_count.toggled.connect(self.setShowFeatureCount)
+        menu.exec_(self.tableView.viewport().mapToGlobal(position))
+
+    def setVisibleClassesOnly(self, enabled):
+        """Show only the classes with features in the canvas extent"""
+        QgsSettings().setValue("LegendView/visibleClassesOnly", bool(enabled))
+        if self.visibleClasses is None:
+            if not enabled:
+                return
+            self.visibleClasses = VisibleClassesFilter(self.iface.mapCanvas(), parent=self)
+            self.visibleClasses.visibleKeysChanged.connect(self.legendChanged)
+        if enabled:
+            # setLayer turns anything but a vector layer into None
+            self.visibleClasses.setLayer(self.currentLayer)
+        self.visibleClasses.setEnabled(enabled)
+        self.showLegend()
+
+    def legendChecksChanged(self, layer_id):
+        """One repaint and one layer tree refresh per batch of toggled classes"""
+        layer = QgsProject.instance().mapLayer(layer_id)
+        if layer is None:
+            return
+        layer.triggerRepaint()
+        # Project dirty flag, style dock and other legends follow styleChanged
+        layer.emitStyleChanged()
+        try:
+            self.iface.layerTreeView().refreshLayerSymbology(layer_id)
+        except AttributeError:
+            # Older QGIS: the layer tree already follows styleChanged
+            pass
+
+    def legendRowDoubleClicked(self, index):
+        if index.isValid() and isinstance(self.currentLayer, QgsVectorLayer):
+            self.selectClassFeatures(self.legendModel.legendRow(index.row()).key)
+
+    def selectClassFeatures(self, key):
+        """Select the features of legend class key in the current layer"""
+        layer = self.currentLayer
+        fids = self.classIndex.featureIds(layer, key)
+        if fids is None:
+            # Done by classIndexReady once the index is built
+            self.pendingClassAction = (layer.id(), key, self.selectClassFeatures)
+            return
+        layer.selectByIds(fids)
+
+    def zoomToClass(self, key):
+        """Zoom the canvas to the bounding box of legend class key"""
+        layer = self.currentLayer
+        index = self.classIndex.index(layer)
+        if index is None:
+            self.pendingClassAction = (layer.id(), key, self.zoomToClass)
+            return
+        extent = index.extent(key)
+        if extent is None:
+            return
+        canvas = self.iface.mapCanvas()
+        try:
+            transform = QgsCoordinateTransform(
+                layer.crs(), canvas.mapSettings().destinationCrs(), QgsProject.instance())
+            extent = transform.transformBoundingBox(extent)
+        except QgsCsException:
+            return
+        if extent.isEmpty():
+            # A single point: keep the scale and center on it
+            canvas.setCenter(extent.center())
+        else:
+            canvas.setExtent(extent)
+        canvas.refresh()
+
+    def classIndexReady(self, layer_id):
+        pending, self.pendingClassAction = self.pendingClassAction, None
+        if pending is None:
+            return
+        pending_layer_id, key, action = pending
+        if pending_layer_id != layer_id or self.currentLayer is None or self.currentLayer.id() != layer_id:
+            # The layer changed in the meantime; keep waiting for ours
+            if pending_layer_id != layer_id:
+                self.pendingClassAction = pending
+            return
+        action(key)
+
+    def setShowFeatureCount(self, enabled):
+        """Append the number of features to each class label"""
+        QgsSettings().setValue("LegendView/showFeatureCount", bool(enabled))
+        self.showFeatureCount = bool(enabled)
+        if enabled and self.featureCounts is None:
+            self.featureCounts = FeatureCountCache(QgsProject.instance(), self, class_index=self.classIndex)
+            self.featureCounts.countsChanged.connect(self.legendChanged)
+        self.showLegend()
+
     def opacityChanged(self,opacity):
         layer = self.currentLayer
         if layer is None:
@@ -211,55 +493,31 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             layer.setOpacity(opacity)
         if isinstance(layer,QgsRasterLayer):
             layer.renderer().setOpacity(opacity)
-        layer.triggerRepaint()
+        # Slider drags are merged into a bounded number of repaints
+        self.repaintThrottle.request(layer)
 
-    def legendChanged(self):
-        self.showLegend()
+    def legendChanged(self, layer_id):
+        # Only the displayed layer needs a rebuild; bursts are merged into one
+        if self.currentLayer is None or self.currentLayer.id() != layer_id:
+            return
+        self.refreshScheduler.schedule()
     
-    def getLayer(self,groups):
-        node = self.root
-
-        for group in groups[:len(groups)-1]:
-            next_node = node.findGroup(group)
-            if isinstance(next_node, QgsLayerTreeGroup):
-                node = next_node
-            else:
-                return None
-
-        for child in node.children():
-            if isinstance(child, QgsLayerTreeLayer):
-                if child.name() == groups[len(groups)-1]:
-                    return child.layer()
-
-        return None
-
+    @profiled('findLayerByVariableName')
     def findLayerByVariableName(self, layer_name_str):
         """Resolve a legend_ variable value to a QgsMapLayer.
 
         The project variable stores the layer path as groups + layer name joined by '_' which
-        is ambiguous if any group or layer name contains underscores. Try all possible
-        split positions where the last element is treated as the layer name (may contain
-        underscores) and return the first matching layer.
+        is ambiguous if any group or layer name contains underscores. Every possible split
+        position is tried against the layer path index, where the last element is treated as
+        the layer name (may contain underscores), and the first matching layer is returned.
         """
-        if not layer_name_str:
-            return None
-
-        tokens = layer_name_str.split('_')
-
-        # Try every possible split: tokens[:i] are groups, '_'.join(tokens[i:]) is layer name
-        for i in range(0, len(tokens)):
-            candidate = tokens[:i] + ['_'.join(tokens[i:])]
-            layer = self.getLayer(candidate)
-            if isinstance(layer, QgsMapLayer):
-                return layer
-
-        return None
+        return self.layerIndex.resolve(layer_name_str)
 
+    @profiled('comboDataSet')
     def comboDataSet(self) :
         ecs = QgsExpressionContextUtils.projectScope(QgsProject.instance())
         slist = ecs.variableNames()
-        layerIdList = []
-        layerIdList2 = []
+        variables = {}
         
         # Process layers with legend_ variables
         for sstr in slist:
@@ -269,27 +527,22 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             # Try to resolve the layer even if group or layer names contain underscores
             layer = self.findLayerByVariableName(layer_name)
             if isinstance(layer, QgsMapLayer) :
-                # Get variable value and handle None safely
-                variable_value = ecs.variable(sstr)
-                self.distributeOrderList(layer.id(), layer_name, variable_value, layerIdList, layerIdList2)
+                variables[sstr] = (layer.id(), layer_name, ecs.variable(sstr))
+
+        # Only variables whose value or layer changed are re-sorted
+        self.legendOrder.update(variables)
 
         # Add current active layer if not already in the list
+        current_entry = None
         current_layer = self.iface.activeLayer()
         if current_layer and isinstance(current_layer, (QgsVectorLayer, QgsRasterLayer)):
-            # Check if current layer is not already in the lists
-            existing_ids = [item[0] for item in layerIdList + layerIdList2]
-            if current_layer.id() not in existing_ids:
-                # Add current layer to the beginning of layerIdList2 with high priority
-                layerIdList2.insert(0, [current_layer.id(), f"current_{current_layer.name()}"])
-
-        if len(layerIdList) > 0:
-            layerIdList.sort(key=itemgetter(1))
-        if len(layerIdList2) > 0:
-            layerIdList2.sort(key=itemgetter(1))
-        layerIdList.extend(layerIdList2)
-
-        for layerid in layerIdList:
-            layer = QgsProject.instance().mapLayer(layerid[0])
+            if current_layer.id() not in self.legendOrder.layerIds():
+                current_entry = OrderEntry(f"current_{current_layer.name()}", "", current_layer.id())
+
+        entries = []
+        listedLayers = []
+        for entry in self.legendOrder.entries(current_entry):
+            layer = QgsProject.instance().mapLayer(entry.layer_id)
             icon = QIcon()
             if isinstance(layer,QgsRasterLayer):
                 icon = QIcon()  # 代替: 空アイコンまたは適切なアイコンに置き換え
@@ -306,18 +559,50 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
             # Display name with current layer indicator
             display_name = layer.name()
-            if isinstance(layerid[1], str) and layerid[1].startswith("current_"):
+            if entry is current_entry:
                 display_name = f"★ {layer.name()} (Current)"
                 
-            self.comboBox.addItem(icon, display_name, layerid[0])
-            # Detect and handle legend change signal for target layer
-            layer.legendChanged.connect(self.legendChanged)
+            entries.append((entry.layer_id, display_name, icon))
+            listedLayers.append(layer)
+
+        self.layerComboModel.setEntries(entries)
+
+        # Detect and handle legend change signal for listed layers (connected once per layer)
+        self.legendSubscriptions.sync(listedLayers)
+
+    def refreshLayerList(self, layer_id=None):
+        """Update the combo box in place and select layer_id
+
+        Without layer_id the current selection is kept.  Index changes are
+        suppressed while the rows are updated, so the legend is rebuilt at
+        most once, and only when the selected layer actually changed.
+        """
+        previous_id = self.comboBox.itemData(self.comboBox.currentIndex())
+        self.comboBox.blockSignals(True)
+        try:
+            self.comboDataSet()
+            index = -1
+            for wanted in (layer_id, previous_id):
+                if wanted is not None:
+                    index = self.layerComboModel.rowForLayer(wanted)
+                    if index >= 0:
+                        break
+            if index < 0 and self.comboBox.count() > 0:
+                index = 0
+            self.comboBox.setCurrentIndex(index)
+        finally:
+            self.comboBox.blockSignals(False)
+
+        if self.comboBox.itemData(index) != previous_id:
+            self.currentIndexChanged(index)
 
-    
     def currentIndexChanged(self,index):
         self.currentLayer = QgsProject.instance().mapLayer(self.comboBox.itemData(index))
+        # A pending refresh is superseded by this rebuild
+        self.refreshScheduler.cancel()
         self.showLegend()
 
+    @profiled('initNamedStyleList')
     def initNamedStyleList(self, layer: QgsMapLayer):
         # Create named style list
 
@@ -345,34 +630,6 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         # Set the layer style with the specified name
         self.currentLayer.styleManager().setCurrentStyle(styleName)
 
-    def distributeOrderList(self, layer_id, layer_name, orderValue, numericList: list, nonNumericList: list):
-
-        while True:
-            # Check for None or QVariant null values first
-            if orderValue is None or isinstance(orderValue, QVariant):
-                break
-            
-            # Convert to string if not already
-            if not isinstance(orderValue, str):
-                try:
-                    orderValue = str(orderValue)
-                except:
-                    break
-
-            m = re.fullmatch(r"\d+", orderValue)
-            if not m is None:
-                numericList.append([layer_id, int(orderValue)])
-                return
-
-            n = re.fullmatch(r"\d*\.\d+", orderValue)
-            if not n is None:
-                numericList.append([layer_id, float(orderValue)])
-                return
-            
-            break
-        
-        nonNumericList.append([layer_id, layer_name])
-
     def _styleComboBoxIndexChanged(self, index):
         """Fallback method for Qt5/Qt6 compatibility when currentTextChanged is not available"""
         if index >= 0:
@@ -384,18 +641,20 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         current_layer = self.iface.activeLayer()
         if current_layer:
             # Search for the corresponding layer from the combo box
-            for i in range(self.comboBox.count()):
-                if self.comboBox.itemData(i) == current_layer.id():
-                    self.comboBox.setCurrentIndex(i)
-                    return
+            index = self.layerComboModel.rowForLayer(current_layer.id())
+            if index >= 0:
+                self.comboBox.setCurrentIndex(index)
+                return
             
-            # コンボボックスにない場合は、リストを更新して再度検索
-            self.comboBox.clear()
-            self.comboDataSet()
-            for i in range(self.comboBox.count()):
-                if self.comboBox.itemData(i) == current_layer.id():
-                    self.comboBox.setCurrentIndex(i)
-                    return
+            # コンボボックスにない場合は、リストを更新して選択
+            self.refreshLayerList(current_layer.id())
+
+    def activeLayerChanged(self, layer):
+        """Follow iface.currentLayerChanged when followCurrentLayer is set"""
+        if not self.followCurrentLayer or not self.populated or not self.isVisible():
+            return
+        if isinstance(layer, (QgsVectorLayer, QgsRasterLayer)):
+            self.selectCurrentLayer()
 
     def registerCurrentLayer(self):
         """Register the currently active layer as a project variable named legend_<group>_<layer>
@@ -407,20 +666,8 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         if not current_layer:
             return
 
-        # Build layer path: traverse layer tree to get group path
-        def find_path(node, target_layer_id, path_parts):
-            for child in node.children():
-                if isinstance(child, QgsLayerTreeLayer):
-                    if child.layer().id() == target_layer_id:
-                        return path_parts + [child.name()]
-                elif isinstance(child, QgsLayerTreeGroup):
-                    res = find_path(child, target_layer_id, path_parts + [child.name()])
-                    if res:
-                        return res
-            return None
-
-        root = QgsProject.instance().layerTreeRoot()
-        path = find_path(root, current_layer.id(), [])
+        # Layer path (groups + layer name) from the shared layer tree path map
+        path = self.layerPaths.path(current_layer.id())
         if not path:
             # fallback to layer name only
             path = [current_layer.name()]
@@ -444,114 +691,76 @@ class LegendViewDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                 # give up silently
                 return
 
-        # Refresh combo box dataset and select the new variable's layer
-        self.comboBox.clear()
-        self.comboDataSet()
-        for i in range(self.comboBox.count()):
-            if self.comboBox.itemData(i) == current_layer.id():
-                self.comboBox.setCurrentIndex(i)
-                break
-
-    def showLegendVariables(self):
-        """Show a dialog listing project variables that start with 'legend_'."""
-        ecs = QgsExpressionContextUtils.projectScope(QgsProject.instance())
-        vars_list = [v for v in ecs.variableNames() if v.startswith('legend_')]
-
-        dlg = QDialog(self)
-        dlg.setWindowTitle(self.tr('Legend variables'))
-        layout = QVBoxLayout(dlg)
-
-        table = QTableWidget(dlg)
-        table.setColumnCount(2)
-        table.setHorizontalHeaderLabels([self.tr('Variable'), self.tr('Value')])
-        table.setRowCount(len(vars_list))
-        # allow row selection for edit/delete
-        try:
-            table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
-            table.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
-        except Exception:
-            pass
-
-        for i, name in enumerate(sorted(vars_list)):
-            value = ecs.variable(name)
-            item_name = QTableWidgetItem(name)
-            item_value = QTableWidgetItem('' if value is None else str(value))
-            item_name.setFlags(item_name.flags() & ~Qt.ItemIsEditable)
-            item_value.setFlags(item_value.flags() & ~Qt.ItemIsEditable)
-            table.setItem(i, 0, item_name)
-            table.setItem(i, 1, item_value)
-
-        table.horizontalHeader().setStretchLastSection(True)
-        layout.addWidget(table)
-        # Buttons: Edit, Delete, Close
-        btn_layout = QHBoxLayout()
-        edit_btn = QPushButton(self.tr('Edit'), dlg)
-        del_btn = QPushButton(self.tr('Delete'), dlg)
-        close_btn = QPushButton(self.tr('Close'), dlg)
-        edit_btn.clicked.connect(lambda: self.editLegendVariable(table))
-        del_btn.clicked.connect(lambda: self.deleteLegendVariable(table))
-        close_btn.clicked.connect(dlg.accept)
-        btn_layout.addWidget(edit_btn)
-        btn_layout.addWidget(del_btn)
-        btn_layout.addWidget(close_btn)
-        layout.addLayout(btn_layout)
-
-        dlg.exec_()
-
-    def editLegendVariable(self, table: QTableWidget):
-        sel = table.selectionModel().selectedRows()
-        if not sel:
-            return
-        row = sel[0].row()
-        name_item = table.item(row, 0)
-        val_item = table.item(row, 1)
-        if name_item is None:
+        # Update the combo box in place and select the new variable's layer
+        self.refreshLayerList(current_layer.id())
+
+    def initRegisterMenu(self):
+        """Bulk registration actions behind the arrow next to Register"""
+        menu = QMenu(self.registerMenuButton)
+        menu.addAction(self.tr('Register checked layers'), self.registerCheckedLayers)
+        menu.addAction(self.tr('Register layers in selected group'), self.registerGroupLayers)
+        self.registerMenuButton.setMenu(menu)
+        popup_mode = getattr(QToolButton, 'InstantPopup', None)
+        if popup_mode is None:
+            popup_mode = QToolButton.ToolButtonPopupMode.InstantPopup
+        self.registerMenuButton.setPopupMode(popup_mode)
+        self.registerMenuButton.setArrowType(DownArrow)
+
+    def registerCheckedLayers(self):
+        self.registerLayers(self.root.checkedLayers())
+
+    def registerGroupLayers(self):
+        """Register every layer below the group selected in the Layers panel"""
+        group = self.iface.layerTreeView().currentGroupNode()
+        if group is None:
             return
-        name = name_item.text()
-        old = '' if val_item is None else val_item.text()
+        self.registerLayers([node.layer() for node in group.findLayers()])
 
-        text, ok = QInputDialog.getText(self, self.tr('Edit variable'), self.tr('Value for %s') % name, text=old)
-        if not ok:
-            return
+    def registerLayers(self, layers):
+        """Register layers as legend_ variables with a single project write
 
-        new_value = text
+        Layers that already have a variable keep their value; the others get
+        the priority from the spin box.  The combo box is refreshed once.
+        Returns the number of variables added.
+        """
+        project = QgsProject.instance()
         try:
-            QgsExpressionContextUtils.setProjectVariable(QgsProject.instance(), name, new_value)
+            priority = str(self.prioritySpinBox.value())
         except Exception:
-            try:
-                QgsProject.instance().writeEntry('LegendView', name, new_value)
-            except Exception:
-                QMessageBox.warning(self, self.tr('Error'), self.tr('Could not update variable'))
-                return
-
-        # update table
-        table.setItem(row, 1, QTableWidgetItem(new_value))
+            priority = ''
 
-    def deleteLegendVariable(self, table: QTableWidget):
-        sel = table.selectionModel().selectedRows()
-        if not sel:
-            return
-        row = sel[0].row()
-        name_item = table.item(row, 0)
-        if name_item is None:
-            return
-        name = name_item.text()
+        new_variables = {}
+        for layer in layers:
+            if not isinstance(layer, (QgsVectorLayer, QgsRasterLayer)):
+                continue
+            path = self.layerPaths.path(layer.id()) or [layer.name()]
+            new_variables.setdefault('legend_' + '_'.join(path), priority)
 
-        resp = QMessageBox.question(self, self.tr('Confirm delete'), self.tr('Delete variable %s?') % name, QMessageBox.Yes | QMessageBox.No)
-        if resp != QMessageBox.Yes:
-            return
+        variables = project.customVariables()
+        added = {name: value for name, value in new_variables.items() if name not in variables}
+        if not added:
+            return 0
 
-        # attempt removal
+        # setProjectVariables replaces the whole set, so merge the existing ones
+        variables.update(added)
         try:
-            # try API if available
-            QgsExpressionContextUtils.removeProjectVariable(QgsProject.instance(), name)
+            QgsExpressionContextUtils.setProjectVariables(project, variables)
         except Exception:
             try:
-                # fallback: write empty string or None
-                QgsProject.instance().writeEntry('LegendView', name, None)
+                for name, value in added.items():
+                    project.writeEntry('LegendView', name, value)
             except Exception:
-                QMessageBox.warning(self, self.tr('Error'), self.tr('Could not remove variable'))
-                return
+                return 0
 
-        # remove row from table
-        table.removeRow(row)
+        self.refreshLayerList()
+        self.iface.messageBar().pushInfo(
+            'LegendView', self.tr('Registered %d layers') % len(added))
+        return len(added)
+
+    def showLegendVariables(self):
+        """Show the legend_ project variables for batched editing"""
+        dlg = LegendVariablesDialog(QgsProject.instance(), self)
+        dlg.exec_()
+        if dlg.committed:
+            # Priorities or registrations changed: update the combo box once
+            self.refreshLayerList()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ SymbolPreviewCache
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ LRU cache of rendered symbol previews.  Entries are keyed by a hash of the
+ symbol definition, so re-showing an unchanged layer (or another layer that
+ shares a symbol) does not render anything again.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+from qgis.core import QgsSymbolLayerUtils
+
+from .qt_compat import QSize, createSymbolPreview
+from .profiling import profiled
+
+# Default budget: roughly 4,000 previews of 55x16 px at 32 bpp
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def symbolKey(symbol):
+    """Stable hash of a symbol definition (its XML properties)"""
+    if symbol is None:
+        return None
+    try:
+        definition = QgsSymbolLayerUtils.symbolProperties(symbol)
+    except Exception:
+        # Unknown symbol type: never share its preview with another symbol
+        definition = 'id:%d' % id(symbol)
+    return hashlib.sha1(definition.encode('utf-8')).hexdigest()
+
+
+def pixmapBytes(pixmap):
+    """Approximate memory used by a pixmap"""
+    depth = pixmap.depth() or 32
+    return max(1, pixmap.width() * pixmap.height() * depth // 8)
+
+
+class SymbolPreviewCache:
+    """Byte-bounded LRU cache of symbol preview pixmaps"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cacheKey(symbol_key, size: QSize, device_pixel_ratio=1.0):
+        return (symbol_key, size.width(), size.height(), round(float(device_pixel_ratio), 2))
+
+    def get(self, key):
+        """Return a cached pixmap (and mark it recently used) or None"""
+        pixmap = self._entries.get(key)
+        if pixmap is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return pixmap
+
+    def insert(self, key, pixmap):
+        cost = pixmapBytes(pixmap)
+        if cost > self._max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._current_bytes -= pixmapBytes(old)
+        self._entries[key] = pixmap
+        self._current_bytes += cost
+        self._evict()
+
+    def preview(self, symbol, size: QSize, device_pixel_ratio=1.0, symbol_key=None):
+        """Return the preview of symbol, rendering it only on a cache miss"""
+        if symbol_key is None:
+            symbol_key = symbolKey(symbol)
+        key = self.cacheKey(symbol_key, size, device_pixel_ratio)
+        pixmap = self.get(key)
+        if pixmap is None:
+            pixmap = renderPreview(symbol, size, device_pixel_ratio)
+            self.insert(key, pixmap)
+        return pixmap
+
+    def setMaxBytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._evict()
+
+    def maxBytes(self):
+        return self._max_bytes
+
+    def currentBytes(self):
+        return self._current_bytes
+
+    def clear(self):
+        self._entries.clear()
+        self._current_bytes = 0
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Counters for tuning the byte budget"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._current_bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def _evict(self):
+        while self._current_bytes > self._max_bytes and self._entries:
+            _, pixmap = self._entries.popitem(last=False)
+            self._current_bytes -= pixmapBytes(pixmap)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@profiled('previewRender')
+def renderPreview(symbol, size: QSize, device_pixel_ratio=1.0):
+    """Render a preview at device resolution for high-DPI screens"""
+    if device_pixel_ratio and device_pixel_ratio != 1.0:
+        device_size = QSize(int(size.width() * device_pixel_ratio),
+                            int(size.height() * device_pixel_ratio))
+        pixmap = createSymbolPreview(symbol, device_size)
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        return pixmap
+    return createSymbolPreview(symbol, size)
+
+
+_shared_cache = None
+
+
+def sharedPreviewCache():
+    """Cache shared by every legend view for the whole QGIS session"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SymbolPreviewCache()
+    return _shared_cache
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PreviewRenderer
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Renders symbol previews on a thread pool.  Workers only touch cloned
+ symbols and QImage, which are safe outside the GUI thread; the QPixmap is
+ created back on the GUI thread when the result is delivered.
+"""
+
+from qgis.PyQt.QtCore import QObject, QRunnable, QThread, QThreadPool
+
+from .qt_compat import QSize, QImage, pyqtSignal
+from .profiling import profiled
+
+
+@profiled('previewRender')
+def renderPreviewImage(symbol, size: QSize, device_pixel_ratio=1.0):
+    """Render symbol to a QImage (same 95% framing as createSymbolPreview)"""
+    ratio = device_pixel_ratio or 1.0
+    image_size = QSize(int(size.width() * 0.95 * ratio), int(size.height() * 0.95 * ratio))
+    image = symbol.asImage(image_size)
+    if ratio != 1.0:
+        image.setDevicePixelRatio(ratio)
+    return image
+
+
+class _PreviewJob(QRunnable):
+
+    def __init__(self, renderer, key, symbol, size, device_pixel_ratio, generation):
+        super(_PreviewJob, self).__init__()
+        self.renderer = renderer
+        self.key = key
+        self.symbol = symbol
+        self.size = size
+        self.device_pixel_ratio = device_pixel_ratio
+        self.generation = generation
+
+    def run(self):
+        # Skip work that was cancelled while waiting in the queue
+        if self.generation != self.renderer.generation:
+            return
+        try:
+            image = renderPreviewImage(self.symbol, self.size, self.device_pixel_ratio)
+        except Exception:
+            image = QImage()
+        try:
+            # Cancelled while rendering: the dock may be closing
+            if self.generation != self.renderer.generation:
+                return
+            self.renderer.imageRendered.emit(self.key, self.generation, image)
+        except RuntimeError:
+            # The renderer was deleted with its dock
+            pass
+
+
+class PreviewRenderer(QObject):
+    """Queue of symbol preview renders running off the GUI thread"""
+
+    # key, generation, image; delivered to the GUI thread by a queued connection
+    imageRendered = pyqtSignal(object, int, QImage)
+
+    def __init__(self, parent=None, max_threads=None):
+        super(PreviewRenderer, self).__init__(parent)
+        self.generation = 0
+        self._pending = set()
+        self._pool = QThreadPool(self)
+        if max_threads is None:
+            max_threads = max(1, QThread.idealThreadCount() - 1)
+        self._pool.setMaxThreadCount(max_threads)
+
+    def request(self, key, symbol, size: QSize, device_pixel_ratio=1.0):
+        """Queue a render of symbol; duplicate requests for a key are ignored"""
+        if key in self._pending:
+            return
+        self._pending.add(key)
+        # The renderer owns the original symbol and may delete it at any time
+        job = _PreviewJob(self, key, symbol.clone(), QSize(size), device_pixel_ratio, self.generation)
+        self._pool.start(job)
+
+    def isPending(self, key):
+        return key in self._pending
+
+    def finished(self, key):
+        self._pending.discard(key)
+
+    def cancel(self):
+        """Drop queued renders and ignore results of those already running"""
+        self.generation += 1
+        self._pending.clear()
+        self._pool.clear()
+
+    def waitForDone(self, msecs=-1):
+        return self._pool.waitForDone(msecs)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DockProfiler
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Opt-in timing of the dock's hot paths.  Enable with the QgsSettings key
+ LegendView/profiling; while it is off a profiled call costs one attribute
+ check.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from qgis.PyQt.QtWidgets import (QDialog, QFileDialog, QHBoxLayout, QPlainTextEdit,
+                                 QPushButton, QVBoxLayout)
+from qgis.core import Qgis, QgsMessageLog, QgsSettings
+
+from .qt_compat import QFont, translate
+
+DEFAULT_BUFFER_SIZE = 1000
+
+
+class DockProfiler:
+    """Per-phase wall time and call counts, plus a ring buffer of recent calls
+
+    Phases may be recorded from preview worker threads, so updates are
+    serialised with a lock.
+    """
+
+    def __init__(self, enabled=False, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # (phase, wall clock start, duration ms, thread name)
+        self._records = deque(maxlen=max(1, int(buffer_size)))
+        # phase -> [calls, total ms, max ms]
+        self._phases = {}
+        # name -> callable returning a dict of counters (e.g. scheduler stats)
+        self._counter_sources = {}
+
+    def setEnabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    def setBufferSize(self, size):
+        with self._lock:
+            self._records = deque(self._records, maxlen=max(1, int(size)))
+
+    def record(self, phase, started, duration_ms):
+        with self._lock:
+            self._records.append((phase, started, duration_ms, threading.current_thread().name))
+            totals = self._phases.get(phase)
+            if totals is None:
+                self._phases[phase] = [1, duration_ms, duration_ms]
+            else:
+                totals[0] += 1
+                totals[1] += duration_ms
+                if duration_ms > totals[2]:
+                    totals[2] = duration_ms
+
+    def setCounters(self, name, source):
+        """Report source() under name with the timings; None removes it"""
+        if source is None:
+            self._counter_sources.pop(name, None)
+        else:
+            self._counter_sources[name] = source
+
+    def counters(self):
+        """name -> counters of every source still alive"""
+        counters = {}
+        for name, source in list(self._counter_sources.items()):
+            try:
+                counters[name] = source()
+            except RuntimeError:
+                # The object behind source was deleted with its dock
+                self._counter_sources.pop(name, None)
+        return counters
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+            self._phases.clear()
+
+    def summary(self):
+        """phase -> calls, total_ms, mean_ms, max_ms"""
+        with self._lock:
+            return {
+                phase: {
+                    'calls': calls,
+                    'total_ms': round(total, 3),
+                    'mean_ms': round(total / calls, 3),
+                    'max_ms': round(longest, 3),
+                }
+                for phase, (calls, total, longest) in self._phases.items()
+            }
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def toJson(self):
+        """Summary and recent calls as JSON, for attaching to bug reports"""
+        report = {
+            'summary': self.summary(),
+            'counters': self.counters(),
+            'records': [
+                {'phase': phase, 'started': round(started, 6), 'ms': round(ms, 3), 'thread': thread}
+                for phase, started, ms, thread in self.records()
+            ],
+        }
+        return json.dumps(report, indent=2, sort_keys=True)
+
+    def dumpJson(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.toJson() + '\n')
+
+    def formatSummary(self):
+        lines = ['%-26s %7s %10s %9s %9s' % ('phase', 'calls', 'total ms', 'mean ms', 'max ms')]
+        summary = self.summary()
+        for phase in sorted(summary, key=lambda name: -summary[name]['total_ms']):
+            values = summary[phase]
+            lines.append('%-26s %7d %10.1f %9.2f %9.2f' % (
+                phase, values['calls'], values['total_ms'], values['mean_ms'], values['max_ms']))
+        counters = self.counters()
+        if counters:
+            lines.append('')
+        for name in sorted(counters):
+            lines.append('%-26s %s' % (name, ', '.join(
+                '%s=%s' % item for item in sorted(counters[name].items()))))
+        return '\n'.join(lines)
+
+    def logSummary(self):
+        QgsMessageLog.logMessage(self.formatSummary(), 'LegendView', Qgis.Info)
+
+
+_shared_profiler = None
+
+
+def sharedProfiler():
+    """Profiler shared by the dock, its models and the preview workers"""
+    global _shared_profiler
+    if _shared_profiler is None:
+        settings = QgsSettings()
+        _shared_profiler = DockProfiler(
+            settings.value("LegendView/profiling", False, type=bool),
+            settings.value("LegendView/profilingBufferSize", DEFAULT_BUFFER_SIZE, type=int))
+    return _shared_profiler
+
+
+def profiled(phase):
+    """Decorator recording each call of the function under phase"""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = sharedProfiler()
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            started = time.time()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(phase, started, (time.perf_counter() - start) * 1000.0)
+        return wrapper
+    return decorate
+
+
+class ProfilerPanel(QDialog):
+    """Debug panel with the per-phase summary of the shared profiler"""
+
+    def __init__(self, profiler=None, parent=None):
+        super(ProfilerPanel, self).__init__(parent)
+        self.profiler = profiler if profiler is not None else sharedProfiler()
+        self.setWindowTitle(translate('LegendView', 'Legend View profiling'))
+
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        font = QFont('Monospace')
+        font.setFixedPitch(True)
+        self.text.setFont(font)
+        layout.addWidget(self.text)
+
+        buttons = QHBoxLayout()
+        for label, slot in ((translate('LegendView', 'Refresh'), self.refresh),
+                            (translate('LegendView', 'Reset'), self.reset),
+                            (translate('LegendView', 'Log'), self.profiler.logSummary),
+                            (translate('LegendView', 'Save JSON...'), self.saveJson)):
+            button = QPushButton(label, self)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        buttons.addStretch()
+        close_button = QPushButton(translate('LegendView', 'Close'), self)
+        close_button.clicked.connect(self.accept)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+
+        self.resize(560, 320)
+        self.refresh()
+
+    def refresh(self):
+        if self.profiler.enabled:
+            self.text.setPlainText(self.profiler.formatSummary())
+        else:
+            self.text.setPlainText(translate(
+                'LegendView', 'Profiling is off. Set LegendView/profiling to true and reopen the dock.'))
+
+    def reset(self):
+        self.profiler.reset()
+        self.refresh()
+
+    def saveJson(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, translate('LegendView', 'Save profile'), 'legendview-profile.json', 'JSON (*.json)')
+        if path:
+            self.profiler.dumpJson(path)
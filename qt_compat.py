@@ -235,3 +235,34 @@ def translate(context, text, disambig=None):
         return QCoreApplication.translate(context, text)
     except:
         return text
+
+
+# Item model/view compatibility constants (flat names on Qt5, scoped enums on Qt6)
+def _qt_enum(scope, name, owner=Qt):
+    """Return Qt.<name> on Qt5 or Qt.<scope>.<name> on Qt6 (owner instead of Qt if given)"""
+    value = getattr(owner, name, None)
+    if value is None:
+        value = getattr(getattr(owner, scope), name)
+    return value
+
+DisplayRole = _qt_enum('ItemDataRole', 'DisplayRole')
+DecorationRole = _qt_enum('ItemDataRole', 'DecorationRole')
+FontRole = _qt_enum('ItemDataRole', 'FontRole')
+ToolTipRole = _qt_enum('ItemDataRole', 'ToolTipRole')
+UserRole = _qt_enum('ItemDataRole', 'UserRole')
+Horizontal = _qt_enum('Orientation', 'Horizontal')
+Vertical = _qt_enum('Orientation', 'Vertical')
+DownArrow = _qt_enum('ArrowType', 'DownArrow')
+EditRole = _qt_enum('ItemDataRole', 'EditRole')
+ItemIsEnabled = _qt_enum('ItemFlag', 'ItemIsEnabled')
+ItemIsSelectable = _qt_enum('ItemFlag', 'ItemIsSelectable')
+ItemIsEditable = _qt_enum('ItemFlag', 'ItemIsEditable')
+CaseInsensitive = _qt_enum('CaseSensitivity', 'CaseInsensitive')
+CustomContextMenu = _qt_enum('ContextMenuPolicy', 'CustomContextMenu')
+CheckStateRole = _qt_enum('ItemDataRole', 'CheckStateRole')
+ItemIsUserCheckable = _qt_enum('ItemFlag', 'ItemIsUserCheckable')
+Checked = _qt_enum('CheckState', 'Checked')
+Unchecked = _qt_enum('CheckState', 'Unchecked')
+PE_IndicatorItemViewItemCheck = _qt_enum('PrimitiveElement', 'PE_IndicatorItemViewItemCheck', QStyle)
+SE_ItemViewItemCheckIndicator = _qt_enum('SubElement', 'SE_ItemViewItemCheckIndicator', QStyle)
+PM_IndicatorWidth = _qt_enum('PixelMetric', 'PM_IndicatorWidth', QStyle)
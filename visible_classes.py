@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ VisibleClassesFilter
+                                 A QGIS plugin
+ Display legend
+                             -------------------
+        begin                : 2020-10-28
+        copyright            : (C) 2020 by soja city.
+        email                : none
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+ Finds the legend classes that have features in the canvas extent.
+
+ The extent is covered with square tiles on a power-of-two grid in layer
+ coordinates.  Each tile is scanned once through the provider's spatial
+ index (QgsFeatureRequest.setFilterRect) in a QgsTask, and the bounding box
+ of every legend key's features in the tile is cached, so panning back over
+ a seen area costs nothing.  The tiles reach beyond the view; a class is
+ only listed when one of its boxes intersects the extent itself.  Boxes are
+ feature bounding boxes, so a class whose features only come close to the
+ view (e.g. a diagonal line passing a corner) may still be listed.
+"""
+
+import math
+from collections import OrderedDict
+
+from qgis.PyQt.QtCore import QObject
+from qgis.core import (QgsApplication, QgsCoordinateTransform, QgsCsException, QgsProject,
+                       QgsRectangle, QgsVectorLayer)
+
+from .qt_compat import pyqtSignal, translate
+from .legend_refresh import LegendRefreshScheduler
+from .layer_scan import LayerScanTask
+
+# Quiet period after the last extentsChanged before the extent is scanned
+DEFAULT_EXTENT_DELAY_MS = 250
+# Tiles kept, over all layers
+TILE_CACHE_SIZE = 512
+
+
+def tileSize(width):
+    """Power-of-two tile size; an extent of this width spans at most 3 tiles"""
+    if not width or width <= 0 or math.isinf(width) or math.isnan(width):
+        return None
+    return 2.0 ** math.floor(math.log2(width))
+
+
+def tilesForExtent(extent, size):
+    """Grid cells (ix, iy) of the given size covering extent"""
+    tiles = []
+    for ix in range(int(math.floor(extent.xMinimum() / size)), int(math.floor(extent.xMaximum() / size)) + 1):
+        for iy in range(int(math.floor(extent.yMinimum() / size)), int(math.floor(extent.yMaximum() / size)) + 1):
+            tiles.append((ix, iy))
+    return tiles
+
+
+class LegendKeyScanTask(LayerScanTask):
+    """Collects the bounding box of each legend key's features in each tile"""
+
+    def __init__(self, layer, tile_size, tiles, callback):
+        super(LegendKeyScanTask, self).__init__(
+            translate('LegendView', 'Finding visible legend classes of %s') % layer.name(), layer, callback)
+        self.tile_size = tile_size
+        self.tiles = list(tiles)
+        self.results = {}
+
+    def scan(self):
+        size = self.tile_size
+        for done, (ix, iy) in enumerate(self.tiles):
+            request = self.featureRequest()
+            request.setFilterRect(QgsRectangle(ix * size, iy * size, (ix + 1) * size, (iy + 1) * size))
+            # legend key -> bounding box of its features in this tile
+            boxes = {}
+            for feature, keys in self.classify(request):
+                if not feature.hasGeometry():
+                    continue
+                box = feature.geometry().boundingBox()
+                for key in keys:
+                    found = boxes.get(key)
+                    if found is None:
+                        boxes[key] = QgsRectangle(box)
+                    else:
+                        found.combineExtentWith(box)
+            if self.isCanceled():
+                return False
+            self.results[(ix, iy)] = boxes
+            self.setProgress(100.0 * (done + 1) / len(self.tiles))
+        return True
+
+
+class VisibleClassesFilter(QObject):
+    """Legend keys of one vector layer that have features in the canvas extent
+
+    visibleKeys() returns None until the current extent has been scanned;
+    visibleKeysChanged is emitted with the layer id once it has.
+    """
+
+    visibleKeysChanged = pyqtSignal(str)
+
+    def __init__(self, canvas, delay_ms=DEFAULT_EXTENT_DELAY_MS, parent=None):
+        super(VisibleClassesFilter, self).__init__(parent)
+        self._canvas = canvas
+        self._layer = None
+        self._enabled = False
+        # (layer id, tile size, ix, iy) -> {legend key: QgsRectangle}, LRU order
+        self._tiles = OrderedDict()
+        self._task = None
+        self._visible = None
+        self._scheduler = LegendRefreshScheduler(self.update, delay_ms, parent=self)
+        self.scans = 0
+
+    def setEnabled(self, enabled):
+        if enabled == self._enabled:
+            return
+        self._enabled = enabled
+        if enabled:
+            self._canvas.extentsChanged.connect(self._scheduler.schedule)
+            self.update()
+        else:
+            self._canvas.extentsChanged.disconnect(self._scheduler.schedule)
+            self._scheduler.cancel()
+            self._cancelTask()
+            self._visible = None
+
+    def isEnabled(self):
+        return self._enabled
+
+    def setLayer(self, layer):
+        """Track layer (a QgsVectorLayer, or None to stop tracking)"""
+        if not isinstance(layer, QgsVectorLayer):
+            layer = None
+        if layer is self._layer:
+            return
+        if self._layer is not None:
+            try:
+                self._layer.dataChanged.disconnect(self._layerChanged)
+                self._layer.rendererChanged.disconnect(self._layerChanged)
+            except (TypeError, RuntimeError):
+                pass
+        self._layer = layer
+        self._visible = None
+        self._cancelTask()
+        if layer is not None:
+            layer.dataChanged.connect(self._layerChanged)
+            layer.rendererChanged.connect(self._layerChanged)
+            if self._enabled:
+                self.update()
+
+    def visibleKeys(self, layer):
+        """Set of legend keys with features in view, or None if not known yet"""
+        if layer is not self._layer:
+            return None
+        return self._visible
+
+    def invalidate(self, layer_id=None):
+        """Forget cached tiles of layer_id (of every layer if None)"""
+        if layer_id is None:
+            self._tiles.clear()
+            return
+        for key in [key for key in self._tiles if key[0] == layer_id]:
+            del self._tiles[key]
+
+    def update(self):
+        """Work out the visible keys for the current extent"""
+        layer = self._layer
+        if not self._enabled or layer is None:
+            return
+        self._cancelTask()
+
+        extent = self._layerExtent(layer)
+        size = tileSize(extent.width()) if extent is not None else None
+        if size is None:
+            # No usable extent: show every class
+            self._setVisible(None)
+            return
+
+        keys = set()
+        missing = []
+        for ix, iy in tilesForExtent(extent, size):
+            cache_key = (layer.id(), size, ix, iy)
+            found = self._tiles.get(cache_key)
+            if found is None:
+                missing.append((ix, iy))
+            else:
+                self._tiles.move_to_end(cache_key)
+                # Tiles reach past the view: keep only boxes inside it
+                keys.update(key for key, box in found.items()
+                            if key not in keys and box.intersects(extent))
+
+        if not missing:
+            self._setVisible(keys)
+            return
+
+        self._task = LegendKeyScanTask(layer, size, missing, self._scanFinished)
+        self.scans += 1
+        QgsApplication.taskManager().addTask(self._task)
+
+    def _layerExtent(self, layer):
+        extent = self._canvas.extent()
+        try:
+            transform = QgsCoordinateTransform(
+                self._canvas.mapSettings().destinationCrs(), layer.crs(), QgsProject.instance())
+            return transform.transformBoundingBox(extent)
+        except QgsCsException:
+            return None
+
+    def _scanFinished(self, task, result):
+        if task is not self._task:
+            return
+        self._task = None
+        if not result:
+            return
+        for tile, keys in task.results.items():
+            self._tiles[(task.layer_id, task.tile_size) + tile] = keys
+        while len(self._tiles) > TILE_CACHE_SIZE:
+            self._tiles.popitem(last=False)
+        # Every tile of the extent is cached now
+        self.update()
+
+    def _setVisible(self, keys):
+        if keys == self._visible:
+            return
+        self._visible = keys
+        if self._layer is not None:
+            self.visibleKeysChanged.emit(self._layer.id())
+
+    def _cancelTask(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            try:
+                task.cancel()
+            except RuntimeError:
+                # Already deleted by the task manager
+                pass
+
+    def _layerChanged(self, *args):
+        if self._layer is not None:
+            self.invalidate(self._layer.id())
+            if self._enabled:
+                self._scheduler.schedule()